@@ -1,6 +1,6 @@
 """Auth API routes: simple email/password signup and login."""
+import asyncio
 from pathlib import Path
-import shutil
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
@@ -40,7 +40,9 @@ async def signup(payload: SignupRequest):
     built-in MVP dataset if it exists, so new users can query immediately.
     """
     try:
-        user = auth_core.create_user(
+        # Blocking SQLite I/O + hashing; keep it off the event loop
+        user = await asyncio.to_thread(
+            auth_core.create_user,
             email=payload.email,
             password=payload.password,
             full_name=payload.full_name,
@@ -59,8 +61,7 @@ async def signup(payload: SignupRequest):
         src_db = db_manager.get_database_path("default_user", "mvp_dataset")
         dst_db = db_manager.get_database_path(user_id, "mvp_dataset")
         if src_db.exists() and not dst_db.exists():
-            dst_db.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src_db, dst_db)
+            await db_manager.clone_database("default_user", "mvp_dataset", user_id, "mvp_dataset")
     except Exception:
         # Non-fatal for signup; just log at API layer if needed later
         pass
@@ -77,7 +78,11 @@ async def signup(payload: SignupRequest):
 @router.post("/auth/login", response_model=AuthResponse)
 async def login(payload: LoginRequest):
     """Log in an existing user and return an access token."""
-    user = auth_core.authenticate_user(email=payload.email, password=payload.password)
+    user = await asyncio.to_thread(
+        auth_core.authenticate_user,
+        email=payload.email,
+        password=payload.password,
+    )
     if not user:
         raise HTTPException(
             status_code=401,
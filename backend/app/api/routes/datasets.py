@@ -1,7 +1,10 @@
 """Dataset management API routes"""
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import orjson
 from typing import List, Optional
+from app.core.cache import response_cache
 from app.core.database import db_manager
 from app.utils.csv_importer import CSVImporter
 
@@ -99,6 +102,12 @@ async def upload_csv(
             table_name=table_name or file.filename.replace('.csv', '').replace('.CSV', ''),
             encoding='utf-8'
         )
+        response_cache.invalidate((user_id, dataset_id))
+        try:
+            # Precompute schema + fingerprint now rather than on the first query
+            await db_manager.refresh_schema(user_id, dataset_id)
+        except Exception:
+            db_manager.invalidate_schema(user_id, dataset_id)
         
         return {
             "success": True,
@@ -115,13 +124,52 @@ async def upload_csv(
         )
 
 
+@router.get("/datasets/{user_id}/{dataset_id}/tables/{table_name}/rows")
+async def export_table_rows(user_id: str, dataset_id: str, table_name: str):
+    """
+    Stream every row of a table as NDJSON (one JSON object per line)
+    
+    Rows are read and sent in batches, so large tables are never held in
+    memory in full.
+    """
+    db_path = db_manager.get_database_path(user_id, dataset_id)
+    if not db_path.exists():
+        raise HTTPException(
+            status_code=404,
+            detail=f"Dataset '{dataset_id}' not found"
+        )
+    
+    schema_info = await db_manager.get_schema(user_id, dataset_id)
+    if table_name not in {t["name"] for t in schema_info["tables"]}:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Table '{table_name}' not found"
+        )
+    
+    quoted = '"' + table_name.replace('"', '""') + '"'
+    
+    async def ndjson_lines():
+        async for batch in db_manager.stream_query(user_id, dataset_id, f"SELECT * FROM {quoted}"):
+            yield b"".join(
+                orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n" for row in batch
+            )
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 @router.delete("/datasets/{user_id}/{dataset_id}")
 async def delete_dataset(user_id: str, dataset_id: str):
     """Delete a dataset"""
     try:
         db_path = db_manager.get_database_path(user_id, dataset_id)
         if db_path.exists():
+            # Release pooled connections before removing the file and its WAL sidecars
+            await db_manager.dispose_engine(user_id, dataset_id)
             db_path.unlink()
+            for suffix in ("-wal", "-shm"):
+                db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
+            db_manager.invalidate_schema(user_id, dataset_id)
+            response_cache.invalidate((user_id, dataset_id))
             return {"deleted": True, "message": f"Dataset '{dataset_id}' deleted"}
         else:
             raise HTTPException(
@@ -1,22 +1,28 @@
 """Query API routes"""
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Callable
+import logging
+import traceback
 from app.services.query_service import QueryService
-from app.services.data_analysis_service import DataAnalysisService
-from app.services.viz_service import VisualizationService
 from app.services.analysis_service import AnalysisService
 from app.services import playbooks
+import numpy as np
 import pandas as pd
-from app.core.database import db_manager
+from app.core.cache import cache_enabled
+from app.core.database import columns_to_records, db_manager
+from app.dependencies import (
+    get_analysis_service,
+    get_data_analysis_service,
+    get_query_service,
+)
+from app.utils.csv_importer import CSVImporter
 
 
 router = APIRouter()
-
-query_service = QueryService()
-data_analysis_service = DataAnalysisService()
-viz_service = VisualizationService()
-analysis_service = AnalysisService()
+logger = logging.getLogger(__name__)
 
 
 class QueryRequest(BaseModel):
@@ -24,6 +30,7 @@ class QueryRequest(BaseModel):
     user_id: str
     dataset_id: str
     query: str
+    no_cache: bool = False
 
 
 class QueryResponse(BaseModel):
@@ -36,8 +43,209 @@ class QueryResponse(BaseModel):
     data_structure: Dict[str, Any]
 
 
-@router.post("/query", response_model=QueryResponse)
-async def execute_query(request: QueryRequest):
+# Playbooks that may run as secondary views alongside the primary one
+SECONDARY_PLAYBOOKS = {
+    "correlation",
+    "distribution",
+    "segment_comparison",
+    "outcome_breakdown",
+    "feature_outcome_profile",
+    "relationship",
+    "segmented_distribution",
+}
+
+
+def _analyze_structure(results: List[Dict[str, Any]], df: pd.DataFrame) -> Dict[str, Any]:
+    """Analyze result structure, degrading to an empty dict on failure"""
+    try:
+        return get_data_analysis_service().analyze_structure(results, df)
+    except Exception as e:
+        logger.error(f"Failed to analyze data structure: {str(e)}")
+        return {}
+
+
+def _build_fetch_query(
+    table: Dict[str, Any],
+    playbook_name: str,
+    analysis_request: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the fixed data-fetch SQL, pushing the planner's row filters into SQL.
+
+    Column names come from the LLM planner, so they are only used if they
+    exist in the table schema; filter values are always bound as parameters.
+
+    Returns:
+        Tuple of (sql, params)
+    """
+    columns = {col["name"] for col in table.get("columns", [])}
+    conditions: List[str] = []
+    params: Dict[str, Any] = {}
+
+    # Segment filter (equality filter only for now)
+    filter_segment = analysis_request.get("filter_segment")
+    if isinstance(filter_segment, dict):
+        col = filter_segment.get("column")
+        value = filter_segment.get("value")
+        if col in columns and isinstance(value, (str, int, float, bool)):
+            conditions.append(f"{CSVImporter.escape_identifier(col)} = :segment_value")
+            params["segment_value"] = value
+
+    # Focus range for a numeric feature
+    focus_range = analysis_request.get("focus_range")
+    if isinstance(focus_range, dict):
+        fr_feature = focus_range.get("feature")
+        fr_min = focus_range.get("min")
+        fr_max = focus_range.get("max")
+        if fr_feature in columns and isinstance(fr_min, (int, float)) and isinstance(fr_max, (int, float)):
+            conditions.append(f"{CSVImporter.escape_identifier(fr_feature)} BETWEEN :range_min AND :range_max")
+            params["range_min"] = fr_min
+            params["range_max"] = fr_max
+
+    sql = f"SELECT * FROM {CSVImporter.escape_identifier(table['name'])}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if playbook_name == "overview":
+        sql += " LIMIT 500"
+    return sql, params
+
+
+PlaybookCall = Tuple[Callable[..., Dict[str, Any]], Dict[str, Any]]
+
+
+def _resolve_playbook(
+    name: str,
+    analysis_request: Dict[str, Any],
+    primary_context: Optional[Dict[str, Any]] = None,
+) -> Optional[PlaybookCall]:
+    """
+    Resolve a playbook name into the function and keyword arguments to run.
+
+    Args:
+        name: Playbook name
+        analysis_request: Validated planner output
+        primary_context: analysis_context of the primary playbook, when running
+            as a secondary view
+
+    Returns:
+        Tuple of (playbook function, kwargs), or None if the name is not a
+        known playbook
+    """
+    target = analysis_request.get("target")
+    feature = analysis_request.get("feature")
+    segment_column = analysis_request.get("segment_column")
+    feature_x = analysis_request.get("feature_x")
+    feature_y = analysis_request.get("feature_y")
+    top_n = analysis_request.get("top_n")
+    bins = analysis_request.get("bins")
+
+    if name == "correlation":
+        return playbooks.correlation_playbook, {"outcome": target or "Outcome", "top_n": top_n or 5}
+    if name == "distribution":
+        # Fallbacks are handled inside the playbook if feature is None or invalid
+        return playbooks.distribution_playbook, {"feature": feature, "bins": bins or 10}
+    if name == "segmented_distribution":
+        return playbooks.segmented_distribution_playbook, {"feature": feature, "segment_column": segment_column}
+    if name == "segment_comparison":
+        # Outcome is optional; playbook will fall back to row counts if not usable
+        return playbooks.segment_comparison_playbook, {"segment_column": segment_column, "outcome": target}
+    if name == "outcome_breakdown":
+        return playbooks.outcome_breakdown_playbook, {"outcome": target or "Outcome"}
+    if name == "feature_outcome_profile":
+        # If we have top_correlations from a primary "drivers" playbook,
+        # pick the strongest feature as the profile target.
+        feature_for_profile = feature
+        if primary_context and primary_context.get("kind") == "correlation":
+            top_corrs = primary_context.get("top_correlations") or {}
+            if isinstance(top_corrs, dict) and top_corrs:
+                feature_for_profile = max(
+                    top_corrs.keys(),
+                    key=lambda k: abs(top_corrs[k] or 0),
+                )
+        return playbooks.feature_outcome_profile_playbook, {
+            "feature": feature_for_profile,
+            "outcome": target or "Outcome",
+            "bins": bins or 8,
+        }
+    if name == "relationship":
+        return playbooks.relationship_playbook, {"feature_x": feature_x, "feature_y": feature_y}
+    if name == "overview":
+        return playbooks.overview_playbook, {}
+    return None
+
+
+def _playbook_key(call: PlaybookCall) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """Memo key identifying a playbook call on the request's DataFrame"""
+    fn, kwargs = call
+    return fn.__name__, tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+
+def _columnarize(
+    columns: Dict[str, List[Any]],
+    column_types: Dict[str, str],
+) -> Dict[str, Any]:
+    """
+    Convert column value lists into typed arrays where possible.
+
+    Columns declared numeric in the schema (SQLite INTEGER/REAL affinity) are
+    built directly into float64 arrays (NULL -> NaN), and INTEGER columns
+    without NULLs are narrowed back to int64, matching what pandas would infer.
+    Anything that does not convert cleanly is left as a list for pandas to
+    infer, so mixed-type SQLite columns behave exactly as before.
+    """
+    arrays: Dict[str, Any] = {}
+    for name, values in columns.items():
+        declared = (column_types.get(name) or "").upper()
+        is_integer = "INT" in declared
+        if is_integer or any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+            try:
+                array = np.fromiter(values, dtype=np.float64, count=len(values))
+            except (TypeError, ValueError):
+                pass
+            else:
+                if (
+                    is_integer
+                    and not np.isnan(array).any()
+                    and np.abs(array).max(initial=0.0) < 2**53
+                    and np.array_equal(array, np.trunc(array))
+                ):
+                    array = array.astype(np.int64)
+                arrays[name] = array
+                continue
+        arrays[name] = values
+    return arrays
+
+
+def _build_dataframe(columns: Dict[str, List[Any]], table: Dict[str, Any]) -> pd.DataFrame:
+    """Build the analysis DataFrame from column-wise query results"""
+    if not columns or not len(next(iter(columns.values()))):
+        return pd.DataFrame()
+    column_types = {col["name"]: col.get("type") for col in table.get("columns", [])}
+    return pd.DataFrame(_columnarize(columns, column_types))
+
+
+def _run_primary_playbook(
+    name: str,
+    df: playbooks.FrameLike,
+    analysis_request: Dict[str, Any],
+) -> Tuple[PlaybookCall, Dict[str, Any]]:
+    """
+    Run the primary playbook (default: overview).
+
+    Returns:
+        Tuple of (resolved playbook call, playbook output)
+    """
+    call = _resolve_playbook(name, analysis_request) or (playbooks.overview_playbook, {})
+    fn, kwargs = call
+    return call, fn(df, **kwargs)
+
+
+@router.post("/query", response_model=QueryResponse, response_class=ORJSONResponse)
+async def execute_query(
+    request: QueryRequest,
+    query_service: QueryService = Depends(get_query_service),
+    analysis_service: AnalysisService = Depends(get_analysis_service),
+):
     """
     Execute a natural language query using analysis playbooks.
 
@@ -45,14 +253,10 @@ async def execute_query(request: QueryRequest):
     1. Get schema context
     2. Use LLM to choose an analysis playbook (no SQL generation)
     3. Execute fixed SQL to fetch data
-    4. Run the playbook to produce visualization + context
+    4. Run the playbooks (concurrently with structure analysis) to produce
+       visualization + context
     5. Generate textual analysis
     """
-    import traceback
-    import logging
-
-    logger = logging.getLogger(__name__)
-
     try:
         # Step 1: Get schema
         try:
@@ -75,12 +279,16 @@ async def execute_query(request: QueryRequest):
                 detail=f"Dataset '{request.dataset_id}' not found or has no tables",
             )
 
-        main_table = tables[0]["name"]
+        main_table = tables[0]
 
         # Step 2: Use LLM to select analysis playbook (no SQL)
         try:
             analysis_request = await query_service.select_analysis(
-                request.query, schema_info
+                request.query,
+                schema_info,
+                user_id=request.user_id,
+                dataset_id=request.dataset_id,
+                use_cache=not request.no_cache,
             )
         except Exception as e:
             logger.error(f"Failed to select analysis: {str(e)}")
@@ -100,29 +308,21 @@ async def execute_query(request: QueryRequest):
 
         intent = analysis_request.get("intent", "overview")
         playbook_name = analysis_request.get("playbook", "overview")
-        target = analysis_request.get("target")
-        feature = analysis_request.get("feature")
-        segment_column = analysis_request.get("segment_column")
-        feature_x = analysis_request.get("feature_x")
-        feature_y = analysis_request.get("feature_y")
-        top_n = analysis_request.get("top_n")
-        bins = analysis_request.get("bins")
-        filter_segment = analysis_request.get("filter_segment")
-        focus_range = analysis_request.get("focus_range")
         secondary_playbooks = analysis_request.get("secondary_playbooks") or []
         mode = analysis_request.get("mode", "quick")
 
-        # Step 3: Execute fixed SQL (no LLM-generated SQL)
-        if playbook_name == "overview":
-            sql = f"SELECT * FROM {main_table} LIMIT 500"
-        else:
-            sql = f"SELECT * FROM {main_table}"
+        # Step 3: Execute fixed SQL (no LLM-generated SQL); planner filters
+        # are applied in SQL so only matching rows are fetched
+        sql, sql_params = _build_fetch_query(main_table, playbook_name, analysis_request)
 
         try:
-            results = await db_manager.execute_query(
+            columns = await db_manager.execute_query(
                 request.user_id,
                 request.dataset_id,
                 sql,
+                params=sql_params,
+                use_cache=cache_enabled(not request.no_cache),
+                columnar=True,
             )
         except Exception as e:
             logger.error(f"Failed to execute query: {str(e)}")
@@ -133,91 +333,25 @@ async def execute_query(request: QueryRequest):
                 detail=f"Failed to execute data fetch: {str(e)}",
             )
 
-        # Step 4: Analyze data structure (generic)
-        try:
-            data_structure = data_analysis_service.analyze_structure(results)
-        except Exception as e:
-            logger.error(f"Failed to analyze data structure: {str(e)}")
-            data_structure = {}
-
-        # Step 5: Build DataFrame and apply any filters from the planner
-        df = pd.DataFrame(results)
-
-        # Apply segment filter if provided (equality filter only for now)
-        if isinstance(filter_segment, dict):
-            col = filter_segment.get("column")
-            value = filter_segment.get("value")
-            if col in df.columns:
-                try:
-                    df = df[df[col] == value]
-                except Exception:
-                    # If filtering fails, keep original df
-                    pass
-
-        # Apply focus range for a numeric feature if provided
-        if isinstance(focus_range, dict):
-            fr_feature = focus_range.get("feature")
-            fr_min = focus_range.get("min")
-            fr_max = focus_range.get("max")
-            if fr_feature in df.columns and isinstance(fr_min, (int, float)) and isinstance(fr_max, (int, float)):
-                try:
-                    series = pd.to_numeric(df[fr_feature], errors="coerce")
-                    mask = series.between(fr_min, fr_max)
-                    df = df[mask]
-                except Exception:
-                    pass
-
-        if playbook_name == "correlation":
-            outcome_col = target or "Outcome"
-            play = playbooks.correlation_playbook(
-                df,
-                outcome=outcome_col,
-                top_n=top_n or 5,
-            )
-        elif playbook_name == "distribution":
-            feature_col = feature
-            # Fallbacks are handled inside the playbook if feature_col is None or invalid
-            play = playbooks.distribution_playbook(
-                df,
-                feature=feature_col,
-                bins=bins or 10,
-            )
-        elif playbook_name == "segmented_distribution":
-            play = playbooks.segmented_distribution_playbook(
-                df,
-                feature=feature,
-                segment_column=segment_column,
-            )
-        elif playbook_name == "segment_comparison":
-            seg_col = segment_column
-            # Outcome is optional; playbook will fall back to row counts if not usable
-            play = playbooks.segment_comparison_playbook(df, segment_column=seg_col, outcome=target)
-        elif playbook_name == "outcome_breakdown":
-            outcome_col = target or "Outcome"
-            play = playbooks.outcome_breakdown_playbook(df, outcome=outcome_col)
-        elif playbook_name == "feature_outcome_profile":
-            feature_col = feature
-            outcome_col = target or "Outcome"
-            play = playbooks.feature_outcome_profile_playbook(
-                df,
-                feature=feature_col,
-                outcome=outcome_col,
-                bins=bins or 8,
-            )
-        elif playbook_name == "relationship":
-            play = playbooks.relationship_playbook(
-                df,
-                feature_x=feature_x,
-                feature_y=feature_y,
-            )
-        else:  # default to overview
-            play = playbooks.overview_playbook(df)
+        # Step 4: Build the DataFrame once; structure analysis and every
+        # playbook read from it. Analysis and the primary playbook are
+        # CPU-bound pandas work, so they run in worker threads to keep the
+        # event loop free.
+        df = await asyncio.to_thread(_build_dataframe, columns, main_table)
+        # Numeric subset and content fingerprint are shared by all playbooks
+        frame = playbooks.PreparedFrame(df)
+        # Row dicts are still the response wire format
+        results = columns_to_records(columns)
+        data_structure, (primary_call, play) = await asyncio.gather(
+            asyncio.to_thread(_analyze_structure, results, df),
+            asyncio.to_thread(_run_primary_playbook, playbook_name, frame, analysis_request),
+        )
 
         visualization = play["visualization"]
         analysis_context = play.get("analysis_context", {})
         merged_structure = {**data_structure, **analysis_context}
 
-        # Step 6: Determine any default secondary playbooks based on INTENT
+        # Step 5: Determine any default secondary playbooks based on INTENT
         # (LLM may still override by explicitly setting secondary_playbooks.)
         if not secondary_playbooks:
             if intent == "drivers":
@@ -228,70 +362,34 @@ async def execute_query(request: QueryRequest):
                 # For group comparisons, a segmented distribution is often helpful.
                 secondary_playbooks = ["segmented_distribution"]
 
-        # Step 7: Optionally run secondary playbooks requested by the planner
-        extra_visualizations: List[Dict[str, Any]] = []
+        # Step 6: Run secondary playbooks requested by the planner concurrently.
+        # Calls identical to the primary (or to each other) are skipped, since
+        # they would recompute and re-render the same chart on the same data.
+        seen_calls = {_playbook_key(primary_call)}
+        secondary_calls: List[Tuple[str, PlaybookCall]] = []
         for secondary in secondary_playbooks:
-            try:
-                if secondary == "correlation":
-                    outcome_col = target or "Outcome"
-                    secondary_play = playbooks.correlation_playbook(
-                        df,
-                        outcome=outcome_col,
-                        top_n=top_n or 5,
-                    )
-                elif secondary == "distribution":
-                    secondary_play = playbooks.distribution_playbook(
-                        df,
-                        feature=feature,
-                        bins=bins or 10,
-                    )
-                elif secondary == "segment_comparison":
-                    secondary_play = playbooks.segment_comparison_playbook(
-                        df,
-                        segment_column=segment_column,
-                        outcome=target,
-                    )
-                elif secondary == "outcome_breakdown":
-                    outcome_col = target or "Outcome"
-                    secondary_play = playbooks.outcome_breakdown_playbook(df, outcome=outcome_col)
-                elif secondary == "feature_outcome_profile":
-                    outcome_col = target or "Outcome"
-                    # If we have top_correlations from the primary "drivers"
-                    # playbook, pick the strongest feature as the profile target.
-                    feature_for_profile = feature
-                    if analysis_context.get("kind") == "correlation":
-                        top_corrs = analysis_context.get("top_correlations") or {}
-                        if isinstance(top_corrs, dict) and top_corrs:
-                            feature_for_profile = max(
-                                top_corrs.keys(),
-                                key=lambda k: abs(top_corrs[k] or 0),
-                            )
-                    secondary_play = playbooks.feature_outcome_profile_playbook(
-                        df,
-                        feature=feature_for_profile,
-                        outcome=outcome_col,
-                        bins=bins or 8,
-                    )
-                elif secondary == "relationship":
-                    secondary_play = playbooks.relationship_playbook(
-                        df,
-                        feature_x=feature_x,
-                        feature_y=feature_y,
-                    )
-                elif secondary == "segmented_distribution":
-                    secondary_play = playbooks.segmented_distribution_playbook(
-                        df,
-                        feature=feature,
-                        segment_column=segment_column,
-                    )
-                else:
-                    continue
-
-                viz = secondary_play.get("visualization")
-                if isinstance(viz, dict):
-                    extra_visualizations.append(viz)
-            except Exception as e:
-                logger.error(f"Secondary playbook '{secondary}' failed: {str(e)}")
+            if secondary not in SECONDARY_PLAYBOOKS:
+                continue
+            call = _resolve_playbook(secondary, analysis_request, analysis_context)
+            key = _playbook_key(call)
+            if key in seen_calls:
+                continue
+            seen_calls.add(key)
+            secondary_calls.append((secondary, call))
+
+        secondary_plays = await asyncio.gather(
+            *(asyncio.to_thread(fn, frame, **kwargs) for _, (fn, kwargs) in secondary_calls),
+            return_exceptions=True,
+        )
+
+        extra_visualizations: List[Dict[str, Any]] = []
+        for (secondary, _), secondary_play in zip(secondary_calls, secondary_plays):
+            if isinstance(secondary_play, Exception):
+                logger.error(f"Secondary playbook '{secondary}' failed: {str(secondary_play)}")
+                continue
+            viz = secondary_play.get("visualization")
+            if isinstance(viz, dict):
+                extra_visualizations.append(viz)
 
         # Step 7: Generate analysis narrative
         try:
@@ -302,6 +400,7 @@ async def execute_query(request: QueryRequest):
                 merged_structure,
                 visualization,
                 extra_visualizations,
+                use_cache=not request.no_cache,
             )
         except Exception as e:
             logger.error(f"Failed to generate analysis: {str(e)}")
@@ -1,10 +1,17 @@
 """Application configuration"""
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
-from typing import List, Union
+from typing import Tuple, Union
 import os
 
 
+DEFAULT_CORS_ORIGINS: Tuple[str, ...] = (
+    "http://localhost:5173",
+    "http://localhost:3000",
+    "https://speakinsights-prototype.onrender.com",
+)
+
+
 class Settings(BaseSettings):
     """Application settings"""
     
@@ -24,10 +31,25 @@ class Settings(BaseSettings):
     # Auth / JWT configuration (sane defaults for a demo app)
     jwt_secret: str = os.environ.get("JWT_SECRET", "change-me-in-production")
     jwt_algorithm: str = "HS256"
+    # PEM keys for asymmetric algorithms (e.g. JWT_ALGORITHM=EdDSA with an
+    # Ed25519 keypair). The public key is derived from the private key if unset.
+    jwt_private_key: str = ""
+    jwt_public_key: str = ""
     access_token_expire_minutes: int = 60
-    
-    # CORS Configuration - handle comma-separated string from env
-    cors_origins: Union[str, List[str]] = "http://localhost:5173,http://localhost:3000,https://speakinsights-prototype.onrender.com"
+
+    # LLM response cache (planner + narrative)
+    response_cache_enabled: bool = True
+    response_cache_ttl_seconds: int = 3600
+    response_cache_max_entries: int = 1024
+    # Save the cache on shutdown and reload it on startup
+    response_cache_persist: bool = True
+
+    # Maximum concurrent LLM calls when generating insights in a batch
+    llm_concurrency: int = 8
+
+    # CORS Configuration - handle comma-separated string from env.
+    # Parsed once into an immutable tuple when settings are loaded.
+    cors_origins: Union[str, Tuple[str, ...]] = ",".join(DEFAULT_CORS_ORIGINS)
     
     @field_validator('cors_origins', mode='before')
     @classmethod
@@ -35,23 +57,13 @@ class Settings(BaseSettings):
         """Parse CORS origins from comma-separated string or list"""
         if isinstance(v, str):
             # Split by comma and strip whitespace
-            origins = [origin.strip() for origin in v.split(",") if origin.strip()]
+            origins = tuple(origin.strip() for origin in v.split(",") if origin.strip())
             # Default origins if empty
-            if not origins:
-                origins = [
-                    "http://localhost:5173",
-                    "http://localhost:3000",
-                    "https://speakinsights-prototype.onrender.com"
-                ]
-            return origins
-        if isinstance(v, list):
-            return v
+            return origins or DEFAULT_CORS_ORIGINS
+        if isinstance(v, (list, tuple)):
+            return tuple(v)
         # Default fallback
-        return [
-            "http://localhost:5173",
-            "http://localhost:3000",
-            "https://speakinsights-prototype.onrender.com"
-        ]
+        return DEFAULT_CORS_ORIGINS
     
     class Config:
         env_file = ".env"
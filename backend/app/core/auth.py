@@ -1,63 +1,222 @@
 """Simple user authentication and JWT utilities."""
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set, Tuple
 import hashlib
 import hmac
-import secrets
 
 import jwt
+import orjson
+from argon2 import PasswordHasher
+from argon2 import low_level as argon2_low_level
+from argon2.exceptions import InvalidHashError, VerificationError
 
 from app.config import settings
 
 
 USERS_DB_PATH = Path(settings.database_path) / "auth.db"
 
+ASYMMETRIC_JWT_ALGORITHMS = {"EdDSA", "ES256", "ES384", "ES512", "RS256", "RS384", "RS512"}
 
-def _get_connection() -> sqlite3.Connection:
-    """Get a SQLite connection to the users database."""
-    USERS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(USERS_DB_PATH)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            full_name TEXT,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-        """
+
+@lru_cache(maxsize=4)
+def _load_asymmetric_keys(private_pem: str, public_pem: str) -> Tuple[Any, Any]:
+    """Parse PEM keys once; later tokens reuse the loaded key objects."""
+    from cryptography.hazmat.primitives.serialization import (
+        load_pem_private_key,
+        load_pem_public_key,
     )
-    conn.commit()
+
+    # Env vars commonly carry PEMs with escaped newlines
+    private_key = load_pem_private_key(
+        private_pem.replace("\\n", "\n").encode("utf-8"), password=None
+    )
+    if public_pem:
+        public_key = load_pem_public_key(public_pem.replace("\\n", "\n").encode("utf-8"))
+    else:
+        public_key = private_key.public_key()
+    return private_key, public_key
+
+
+@lru_cache(maxsize=4)
+def _hmac_key(secret: str) -> bytes:
+    """Encode the shared secret once rather than on every token."""
+    return secret.encode("utf-8")
+
+
+def _jwt_keys() -> Tuple[Any, Any]:
+    """Return the (signing, verification) keys for the configured algorithm."""
+    if settings.jwt_algorithm not in ASYMMETRIC_JWT_ALGORITHMS:
+        key = _hmac_key(settings.jwt_secret)
+        return key, key
+    return _load_asymmetric_keys(settings.jwt_private_key, settings.jwt_public_key)
+
+
+class _OrjsonJWT(jwt.PyJWT):
+    """PyJWT using orjson for the claims payload (via its documented hooks)."""
+
+    def _encode_payload(self, payload, headers=None, json_encoder=None) -> bytes:
+        if json_encoder is not None:
+            return super()._encode_payload(payload, headers, json_encoder)
+        return orjson.dumps(payload)
+
+    def _decode_payload(self, decoded: Dict[str, Any]) -> Any:
+        try:
+            payload = orjson.loads(decoded["payload"])
+        except orjson.JSONDecodeError as e:
+            raise jwt.DecodeError(f"Invalid payload string: {e}")
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+
+_jwt = _OrjsonJWT()
+
+
+CREATE_USERS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    full_name TEXT,
+    password_hash TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+)
+"""
+INSERT_USER_SQL = """
+INSERT INTO users (email, full_name, password_hash, created_at)
+VALUES (?, ?, ?, ?)
+"""
+SELECT_USER_BY_EMAIL_SQL = (
+    "SELECT id, email, full_name, password_hash, created_at FROM users WHERE email = ?"
+)
+UPDATE_PASSWORD_HASH_SQL = "UPDATE users SET password_hash = ? WHERE id = ?"
+
+# Connections are cached per thread (sqlite3 handles are not shareable) and
+# per path, since tests point USERS_DB_PATH at temporary databases.
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths: Set[Path] = set()
+
+
+def init_auth_db(path: Optional[Path] = None) -> None:
+    """
+    Create the users table once per database file.
+
+    Called at application startup; connections also call it lazily so a
+    database at a new path (e.g. in tests) is initialized on first use.
+    """
+    path = path or USERS_DB_PATH
+    with _init_lock:
+        if path in _initialized_paths:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(CREATE_USERS_TABLE_SQL)
+            conn.commit()
+        finally:
+            conn.close()
+        _initialized_paths.add(path)
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Get this thread's cached SQLite connection to the users database."""
+    path = USERS_DB_PATH
+    connections: Dict[Path, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        init_auth_db(path)
+        conn = sqlite3.connect(path, cached_statements=128)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        connections[path] = conn
     return conn
 
 
+_password_hasher = PasswordHasher()
+
+
+def _legacy_hash_password(password: str, salt: str) -> str:
+    """
+    Legacy salted SHA-256 hash in the format salt$hash.
+
+    Only used to verify accounts created before Argon2 hashing; those are
+    rehashed on their next successful login.
+    """
+    return f"{salt}${_legacy_digest(password, salt).hex()}"
+
+
+def _legacy_digest(password: str, salt: str) -> bytes:
+    """Raw SHA-256 digest behind a legacy salt$hash value."""
+    return hashlib.sha256(salt.encode("utf-8") + password.encode("utf-8")).digest()
+
+
 def _hash_password(password: str, salt: Optional[str] = None) -> str:
     """
-    Hash a password with a salt using SHA-256.
+    Hash a password with Argon2id.
 
-    Stored format: salt$hash
-    This is sufficient for a demo project; for production use, prefer bcrypt/argon2.
+    Stored format is the standard encoded string ($argon2id$v=19$...), which
+    carries its own salt and cost parameters. A salt is generated unless one
+    is given (useful for deterministic tests).
     """
     if salt is None:
-        salt = secrets.token_hex(16)
-    pwd_bytes = password.encode("utf-8")
-    salt_bytes = salt.encode("utf-8")
-    digest = hashlib.sha256(salt_bytes + pwd_bytes).hexdigest()
-    return f"{salt}${digest}"
+        return _password_hasher.hash(password)
+    ph = _password_hasher
+    raw = argon2_low_level.hash_secret(
+        password.encode("utf-8"),
+        salt.encode("utf-8"),
+        time_cost=ph.time_cost,
+        memory_cost=ph.memory_cost,
+        parallelism=ph.parallelism,
+        hash_len=ph.hash_len,
+        type=ph.type,
+    )
+    return raw.decode("ascii")
+
+
+def _is_legacy_hash(stored: str) -> bool:
+    """Whether a stored hash predates Argon2 (salt$sha256 format)."""
+    return not stored.startswith("$argon2")
 
 
 def _verify_password(password: str, stored: str) -> bool:
-    """Verify a password against a stored salt$hash value."""
+    """Verify a password against a stored Argon2 or legacy salt$hash value."""
+    if _is_legacy_hash(stored):
+        try:
+            salt, stored_hex = stored.split("$", 1)
+            expected = bytes.fromhex(stored_hex)
+        except ValueError:
+            return False
+        # Constant-time comparison of the raw 32-byte digests
+        return hmac.compare_digest(_legacy_digest(password, salt), expected)
     try:
-        salt, _hash = stored.split("$", 1)
-    except ValueError:
+        return _password_hasher.verify(stored, password)
+    except (VerificationError, InvalidHashError):
         return False
-    candidate = _hash_password(password, salt)
-    # Use constant-time comparison
-    return hmac.compare_digest(candidate, stored)
+
+
+def _update_password_hash(user_id: str, password_hash: str) -> None:
+    """Replace a user's stored password hash."""
+    conn = _get_connection()
+    with conn:
+        conn.execute(UPDATE_PASSWORD_HASH_SQL, (password_hash, int(user_id)))
+
+
+def _normalize_email(email: str) -> str:
+    """
+    Canonical form emails are stored and looked up in.
+
+    Normalizing in Python (full Unicode case folding via lower()) keeps
+    lookups an exact match on the UNIQUE email index.
+    """
+    return email.strip().lower()
 
 
 def create_user(email: str, password: str, full_name: Optional[str] = None) -> Dict[str, Any]:
@@ -66,43 +225,37 @@ def create_user(email: str, password: str, full_name: Optional[str] = None) -> D
 
     Returns a simple user dict with an application-level user_id (string).
     """
+    email = _normalize_email(email)
+    password_hash = _hash_password(password)
+    created_at = time.time_ns() // 1_000_000
     conn = _get_connection()
-    try:
-        password_hash = _hash_password(password)
-        created_at = datetime.now(timezone.utc).isoformat()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO users (email, full_name, password_hash, created_at)
-            VALUES (?, ?, ?, ?)
-            """,
-            (email.lower().strip(), full_name, password_hash, created_at),
+    # Commits on success, rolls back (keeping the cached connection clean) on error
+    with conn:
+        cur = conn.execute(
+            INSERT_USER_SQL,
+            (email, full_name, password_hash, created_at),
         )
         user_pk = cur.lastrowid
-        conn.commit()
-    finally:
-        conn.close()
 
     user_id = str(user_pk)
     return {
         "user_id": user_id,
-        "email": email.lower().strip(),
+        "email": email,
         "full_name": full_name,
     }
 
 
+def _format_created_at(value: Any) -> Any:
+    """Render a stored epoch-ms timestamp as ISO 8601; older rows already hold ISO text."""
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).isoformat()
+    return value
+
+
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Fetch a user record by email."""
     conn = _get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, email, full_name, password_hash, created_at FROM users WHERE email = ?",
-            (email.lower().strip(),),
-        )
-        row = cur.fetchone()
-    finally:
-        conn.close()
+    row = conn.execute(SELECT_USER_BY_EMAIL_SQL, (_normalize_email(email),)).fetchone()
 
     if not row:
         return None
@@ -112,7 +265,7 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         "email": row[1],
         "full_name": row[2],
         "password_hash": row[3],
-        "created_at": row[4],
+        "created_at": _format_created_at(row[4]),
     }
 
 
@@ -121,8 +274,12 @@ def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
     user = get_user_by_email(email)
     if not user:
         return None
-    if not _verify_password(password, user["password_hash"]):
+    stored = user["password_hash"]
+    if not _verify_password(password, stored):
         return None
+    # Upgrade legacy hashes (and outdated Argon2 parameters) on login
+    if _is_legacy_hash(stored) or _password_hasher.check_needs_rehash(stored):
+        _update_password_hash(user["user_id"], _hash_password(password))
     # Don't leak hash
     user.pop("password_hash", None)
     return user
@@ -136,11 +293,12 @@ def create_access_token(
     to_encode = data.copy()
     if expires_delta is None:
         expires_delta = timedelta(minutes=settings.access_token_expire_minutes)
-    expire = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(
+    # Integer epoch seconds, which PyJWT accepts without a datetime round-trip
+    to_encode["exp"] = int(time.time() + expires_delta.total_seconds())
+    signing_key, _ = _jwt_keys()
+    encoded_jwt = _jwt.encode(
         to_encode,
-        settings.jwt_secret,
+        signing_key,
         algorithm=settings.jwt_algorithm,
     )
     return encoded_jwt
@@ -148,10 +306,11 @@ def create_access_token(
 
 def decode_access_token(token: str) -> Dict[str, Any]:
     """Decode and validate a JWT token."""
-    payload = jwt.decode(
+    _, verification_key = _jwt_keys()
+    payload = _jwt.decode(
         token,
-        settings.jwt_secret,
-        algorithms=[settings.jwt_algorithm],
+        verification_key,
+        algorithms=(settings.jwt_algorithm,),
     )
     return payload
 
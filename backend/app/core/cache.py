@@ -0,0 +1,217 @@
+"""In-process response cache for expensive LLM round-trips"""
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Set, Tuple, Union
+
+import orjson
+
+from app.config import settings
+
+
+# numpy scalars/arrays and non-string keys (e.g. integer segment labels)
+# serialize natively; anything else falls back to str()
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def fingerprint(obj: Any) -> str:
+    """Stable SHA-256 fingerprint of a JSON-serializable object"""
+    payload = orjson.dumps(obj, default=str, option=JSON_OPTIONS | orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Build a compact cache key from an ordered list of parts"""
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a natural language query for exact-match caching"""
+    return " ".join(query.strip().lower().split())
+
+
+class ResponseCache:
+    """
+    Bounded TTL + LRU cache for JSON-serializable responses.
+
+    Values are stored orjson-encoded so every hit returns a fresh copy that
+    callers are free to mutate. Entries can carry a tag (e.g. a
+    (user_id, dataset_id) pair) so that all responses derived from a dataset
+    can be dropped when that dataset changes.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Optional[Hashable]]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[str]] = {}
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on miss/expiry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload, tag = entry
+            if expires_at < time.monotonic():
+                self._remove(key, tag)
+                return None
+            self._entries.move_to_end(key)
+        return orjson.loads(payload)
+
+    def set(self, key: str, value: Any, tag: Optional[Hashable] = None) -> None:
+        """Store a value under key, evicting the least recently used entry if full"""
+        payload = orjson.dumps(value, default=str, option=JSON_OPTIONS)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._remove(key, old[2])
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key, (_, _, oldest_tag) = next(iter(self._entries.items()))
+                self._remove(oldest_key, oldest_tag)
+
+    def invalidate(self, tag: Hashable) -> int:
+        """Drop every entry stored with the given tag; returns the number removed"""
+        with self._lock:
+            keys = self._tags.pop(tag, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            return len(keys)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def save(self, path: Union[str, Path]) -> int:
+        """
+        Best-effort snapshot of live entries to a JSON file.
+
+        Expiry is stored as wall-clock time so a later process can restore
+        the remaining TTL. Returns the number of entries written.
+        """
+        now_mono, now_wall = time.monotonic(), time.time()
+        with self._lock:
+            entries = [
+                [key, now_wall + (expires_at - now_mono), orjson.Fragment(payload), tag]
+                for key, (expires_at, payload, tag) in self._entries.items()
+                if expires_at > now_mono
+            ]
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            tmp_path.write_bytes(orjson.dumps(entries))
+            tmp_path.replace(path)
+        except OSError:
+            return 0
+        return len(entries)
+
+    def load(self, path: Union[str, Path]) -> int:
+        """
+        Restore entries written by save(), skipping any that have expired.
+
+        A missing or unreadable file is ignored. Returns the number of
+        entries restored.
+        """
+        try:
+            entries = orjson.loads(Path(path).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return 0
+        now_mono, now_wall = time.monotonic(), time.time()
+        restored = 0
+        with self._lock:
+            # Oldest first, so LRU order and eviction match the saved cache
+            for key, expires_wall, value, tag in entries:
+                if expires_wall <= now_wall or key in self._entries:
+                    continue
+                # JSON has no tuples; tags are (user_id, dataset_id) pairs
+                tag = tuple(tag) if isinstance(tag, list) else tag
+                payload = orjson.dumps(value, option=JSON_OPTIONS)
+                self._entries[key] = (now_mono + (expires_wall - now_wall), payload, tag)
+                if tag is not None:
+                    self._tags.setdefault(tag, set()).add(key)
+                restored += 1
+            while len(self._entries) > self.max_entries:
+                oldest_key, (_, _, oldest_tag) = next(iter(self._entries.items()))
+                self._remove(oldest_key, oldest_tag)
+        return restored
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str, tag: Optional[Hashable]) -> None:
+        self._entries.pop(key, None)
+        if tag is not None and tag in self._tags:
+            self._tags[tag].discard(key)
+            if not self._tags[tag]:
+                del self._tags[tag]
+
+
+class ObjectCache:
+    """
+    Bounded TTL + LRU cache that keeps values as Python objects.
+
+    Values are deep-copied on the way in and out instead of going through
+    JSON, so NaN, numpy scalars, tuples and non-string keys come back exactly
+    as stored and a hit is indistinguishable from a fresh computation.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value for key, or None on miss/expiry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a copy of value under key, evicting the least recently used entry if full"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cache_enabled(use_cache: bool = True) -> bool:
+    """Whether response caching should be used for this call"""
+    return use_cache and not settings.debug and settings.response_cache_enabled
+
+
+# Global response cache instance
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+)
+
+# Snapshot of response_cache kept across restarts (see app.main)
+RESPONSE_CACHE_PATH = Path(settings.database_path) / "response_cache.json"
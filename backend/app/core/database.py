@@ -1,18 +1,116 @@
 """Database connection and management"""
+import asyncio
+import copy
+import json
 import os
+import shutil
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from sqlalchemy import text
+from typing import Optional, Dict, Any, List, Sequence, Tuple, AsyncIterator, Union
+from sqlalchemy import event, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.core.cache import fingerprint
+
+
+@lru_cache(maxsize=1024)
+def _first_statement(sql: str) -> str:
+    """
+    Return the first non-empty statement in a SQL string.
+
+    Single pass that ignores semicolons inside quoted strings/identifiers and
+    comments. Returns "" if the input holds no statement.
+    """
+    if ";" not in sql:
+        return sql.strip()
+
+    start = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"', "`"):
+            # Quoted literal/identifier; doubled quotes are escapes and are
+            # handled by simply re-entering this branch
+            end = sql.find(ch, i + 1)
+            i = n if end == -1 else end + 1
+            continue
+        if ch == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i + 2)
+            i = n if end == -1 else end + 1
+            continue
+        if ch == "/" and sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if ch == ";":
+            statement = sql[start:i].strip()
+            if statement:
+                return statement
+            start = i + 1
+        i += 1
+    return sql[start:].strip()
+
+
+def rows_to_columns(names: Sequence[str], rows: Sequence[Sequence[Any]]) -> Dict[str, List[Any]]:
+    """Transpose result rows into one list per column"""
+    if not rows:
+        return {name: [] for name in names}
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+
+def columns_to_records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Turn column lists back into a list of row dicts"""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
 
 
 class DatabaseManager:
     """Manages database connections for users"""
+
+    # Per-dataset connection pool sizing
+    POOL_SIZE = 4
+    POOL_MAX_OVERFLOW = 4
+
+    # Engine cache bounds: least recently used engines beyond MAX_ENGINES,
+    # and engines idle for longer than ENGINE_IDLE_SECONDS, are disposed.
+    MAX_ENGINES = 64
+    ENGINE_IDLE_SECONDS = 900
+
+    # Applied to every new SQLite connection: WAL allows concurrent readers,
+    # and a larger page cache / mmap keeps repeated scans in memory.
+    SQLITE_PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA mmap_size=268435456",
+    )
+
+    # Schema cache bounds
+    SCHEMA_CACHE_MAX_ENTRIES = 1024
+    SCHEMA_CACHE_TTL_SECONDS = 300
+
+    # Result cache bounds: only small result sets (e.g. the LIMIT 500
+    # overview fetch) are kept, so memory stays bounded.
+    RESULT_CACHE_MAX_ENTRIES = 256
+    RESULT_CACHE_MAX_ROWS = 1000
     
     def __init__(self):
-        self.connections: Dict[str, Any] = {}
+        # cache_key -> engine, least recently used first
+        self.connections: "OrderedDict[str, Any]" = OrderedDict()
+        self._engine_last_used: Dict[str, float] = {}
+        self._disposals: set = set()
+        # cache_key -> (file version, expires_at, schema_info)
+        self._schema_cache: "OrderedDict[str, Tuple[Tuple[int, ...], float, Dict[str, Any]]]" = OrderedDict()
+        # (user_id, dataset_id, sql, params) -> (file version, rows)
+        self._result_cache: "OrderedDict[Tuple[Any, ...], Tuple[Tuple[int, ...], List[Dict[str, Any]]]]" = OrderedDict()
         self.data_path = Path(settings.database_path)
         self.data_path.mkdir(parents=True, exist_ok=True)
     
@@ -30,25 +128,134 @@ class DatabaseManager:
     async def get_engine(self, user_id: str, dataset_id: str):
         """Get or create async engine for user's database"""
         cache_key = f"{user_id}:{dataset_id}"
+        now = time.monotonic()
         
-        if cache_key not in self.connections:
+        if cache_key in self.connections:
+            self.connections.move_to_end(cache_key)
+        else:
+            self._evict_engines(now)
             conn_str = self.get_connection_string(user_id, dataset_id)
+            # aiosqlite defaults to NullPool (a new connection per checkout);
+            # keep a small warm pool per dataset instead.
             engine = create_async_engine(
                 conn_str,
                 echo=False,
-                pool_pre_ping=True
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.POOL_MAX_OVERFLOW,
             )
+            event.listen(engine.sync_engine, "connect", self._configure_sqlite_connection)
             self.connections[cache_key] = engine
         
+        self._engine_last_used[cache_key] = now
         return self.connections[cache_key]
-    
+
+    def _evict_engines(self, now: float):
+        """Dispose idle engines and trim the cache to make room for a new one"""
+        idle_before = now - self.ENGINE_IDLE_SECONDS
+        for key in [k for k, used in self._engine_last_used.items() if used < idle_before]:
+            self._discard_engine(key)
+        while len(self.connections) >= self.MAX_ENGINES:
+            self._discard_engine(next(iter(self.connections)))
+
+    def _discard_engine(self, cache_key: str):
+        """Forget an engine and dispose its pool in the background"""
+        self._engine_last_used.pop(cache_key, None)
+        engine = self.connections.pop(cache_key, None)
+        if engine is None:
+            return
+        # Connections checked out by in-flight queries are closed on return
+        task = asyncio.get_running_loop().create_task(engine.dispose())
+        self._disposals.add(task)
+        task.add_done_callback(self._disposals.discard)
+
+    @classmethod
+    def _configure_sqlite_connection(cls, dbapi_connection, connection_record):
+        """Apply SQLite tuning pragmas to a freshly opened connection"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in cls.SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    @asynccontextmanager
+    async def acquire(self, user_id: str, dataset_id: str) -> AsyncIterator[AsyncConnection]:
+        """Check out a pooled connection for a dataset"""
+        engine = await self.get_engine(user_id, dataset_id)
+        async with engine.connect() as conn:
+            yield conn
+
+    async def dispose_engine(self, user_id: str, dataset_id: str):
+        """Close and forget the pooled connections for a dataset"""
+        cache_key = f"{user_id}:{dataset_id}"
+        self._engine_last_used.pop(cache_key, None)
+        engine = self.connections.pop(cache_key, None)
+        if engine is not None:
+            await engine.dispose()
+
+    @staticmethod
+    def _copy_file_range(src: Path, dst: Path):
+        """Copy a file in-kernel (reflinks on filesystems that support it)"""
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        shutil.copystat(src, dst)
+
+    @staticmethod
+    def _checkpoint(db_path: Path, timeout: int = 30):
+        """Fold a database's WAL back into the main file and truncate it"""
+        conn = sqlite3.connect(db_path, timeout=timeout)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+    def _copy_database(self, src_db: Path, dst_db: Path):
+        """Checkpoint src_db, then copy its main file to dst_db"""
+        self._checkpoint(src_db)
+        if hasattr(os, "copy_file_range"):
+            try:
+                self._copy_file_range(src_db, dst_db)
+                return
+            except OSError:
+                dst_db.unlink(missing_ok=True)
+        shutil.copy2(src_db, dst_db)
+
+    async def clone_database(
+        self,
+        src_user_id: str,
+        src_dataset_id: str,
+        user_id: str,
+        dataset_id: str,
+    ):
+        """
+        Seed a dataset with a private copy of another dataset's database file.
+
+        The source's pooled connections are released and its WAL checkpointed
+        first, so the copied main file holds every committed page. The copy is
+        in-kernel where possible (a reflink on filesystems that support it),
+        falling back to a plain copy.
+        """
+        src_db = self.get_database_path(src_user_id, src_dataset_id)
+        dst_db = self.get_database_path(user_id, dataset_id)
+        await self.dispose_engine(src_user_id, src_dataset_id)
+        await asyncio.to_thread(self._copy_database, src_db, dst_db)
+
     async def execute_query(
         self,
         user_id: str,
         dataset_id: str,
         sql: str,
-        timeout: int = 30
-    ) -> List[Dict[str, Any]]:
+        timeout: int = 30,
+        params: Optional[Dict[str, Any]] = None,
+        use_cache: bool = False,
+        columnar: bool = False,
+    ) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]:
         """
         Execute SQL query and return results
         
@@ -57,9 +264,14 @@ class DatabaseManager:
             dataset_id: Dataset identifier
             sql: SQL query to execute
             timeout: Query timeout in seconds
+            params: Optional bound parameters for named placeholders (:name)
+            use_cache: Serve small result sets from memory while the
+                database file is unchanged
+            columnar: Return one list per column instead of one dict per row
             
         Returns:
-            List of result rows as dictionaries
+            List of result rows as dictionaries, or a dict of column name to
+            values if columnar is set
             
         Raises:
             FileNotFoundError: If database file doesn't exist
@@ -74,34 +286,178 @@ class DatabaseManager:
                 f"Please ensure the dataset '{dataset_id}' has been imported."
             )
         
-        # Extract only the first statement if multiple are present
-        # Split by semicolon and take the first non-empty statement
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        if not statements:
+        # Use only the first statement if multiple are present
+        sql = _first_statement(sql)
+        if not sql:
             raise ValueError("No valid SQL statement found")
+
+        if use_cache:
+            cache_key = (user_id, dataset_id, sql, tuple(sorted((params or {}).items())))
+            version = self._schema_version(db_path)
+            cached = self._result_cache.get(cache_key)
+            if cached is not None and cached[0] == version:
+                self._result_cache.move_to_end(cache_key)
+                if columnar:
+                    return {name: list(values) for name, values in cached[1].items()}
+                return columns_to_records(cached[1])
         
-        # Use only the first statement
-        sql = statements[0]
-        
-        engine = await self.get_engine(user_id, dataset_id)
-        
-        async with engine.begin() as conn:
+        async with self.acquire(user_id, dataset_id) as conn:
             # Set timeout
             await conn.execute(text(f"PRAGMA busy_timeout = {timeout * 1000}"))
             
             # Execute query
-            result = await conn.execute(text(sql))
+            result = await conn.execute(text(sql), params or {})
             
             # Fetch results
             rows = result.fetchall()
             
-            # Convert to list of dicts
-            columns = result.keys()
-            return [dict(zip(columns, row)) for row in rows]
+            names = list(result.keys())
+
+        # Cached results are kept column-wise: one list per column rather
+        # than a dict per row.
+        cacheable = use_cache and len(rows) <= self.RESULT_CACHE_MAX_ROWS
+        columns = rows_to_columns(names, rows) if (columnar or cacheable) else None
+
+        # Only keep results if the file did not change while the query ran
+        if cacheable and self._schema_version(db_path) == version:
+            self._result_cache[cache_key] = (
+                version,
+                {name: list(values) for name, values in columns.items()},
+            )
+            self._result_cache.move_to_end(cache_key)
+            while len(self._result_cache) > self.RESULT_CACHE_MAX_ENTRIES:
+                self._result_cache.popitem(last=False)
+
+        if columnar:
+            return columns
+        # Convert to list of dicts
+        return [dict(zip(names, row)) for row in rows]
+
+    async def stream_query(
+        self,
+        user_id: str,
+        dataset_id: str,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Execute SQL query and yield result rows in batches
+        
+        Rows are read incrementally from a server-side cursor, so memory is
+        bounded by batch_size rather than by the size of the result.
+        
+        Args:
+            user_id: User identifier
+            dataset_id: Dataset identifier
+            sql: SQL query to execute
+            params: Optional bound parameters for named placeholders (:name)
+            batch_size: Rows per yielded batch
+            
+        Yields:
+            Lists of result rows as dictionaries
+        """
+        db_path = self.get_database_path(user_id, dataset_id)
+        if not db_path.exists():
+            raise FileNotFoundError(
+                f"Database file not found: {db_path}. "
+                f"Please ensure the dataset '{dataset_id}' has been imported."
+            )
+        
+        sql = _first_statement(sql)
+        if not sql:
+            raise ValueError("No valid SQL statement found")
+        
+        async with self.acquire(user_id, dataset_id) as conn:
+            result = await conn.stream(text(sql), params or {})
+            names = list(result.keys())
+            async for partition in result.partitions(batch_size):
+                yield [dict(zip(names, row)) for row in partition]
     
+    @staticmethod
+    def _schema_version(db_path: Path) -> Tuple[int, ...]:
+        """Modification stamp of the database file (and its WAL, if any)"""
+        version = [db_path.stat().st_mtime_ns]
+        wal_path = db_path.with_name(db_path.name + "-wal")
+        if wal_path.exists():
+            version.append(wal_path.stat().st_mtime_ns)
+        return tuple(version)
+
+    @staticmethod
+    def _sidecar_version(db_path: Path, timeout: int = 30) -> Optional[Tuple[int, ...]]:
+        """
+        Content stamp of a database for the schema sidecar.
+
+        The WAL is checkpointed first so the stamp depends only on the main
+        file (schema_version, mtime, size), not on whether a -wal file happens
+        to exist; a clean shutdown deletes it. Returns None if the WAL could
+        not be fully checkpointed, in which case the sidecar is not trusted.
+        """
+        conn = sqlite3.connect(db_path, timeout=timeout)
+        try:
+            busy, log_frames, checkpointed = conn.execute(
+                "PRAGMA wal_checkpoint(TRUNCATE)"
+            ).fetchone()
+            if busy or log_frames != checkpointed:
+                return None
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        finally:
+            conn.close()
+        stat = db_path.stat()
+        return (schema_version, stat.st_mtime_ns, stat.st_size)
+
+    def get_schema_meta_path(self, user_id: str, dataset_id: str) -> Path:
+        """Get path to the schema sidecar file stored next to a dataset"""
+        db_path = self.get_database_path(user_id, dataset_id)
+        return db_path.with_name(db_path.name + ".meta.json")
+
+    @staticmethod
+    def _read_schema_meta(meta_path: Path, version: Tuple[int, ...]) -> Optional[Dict[str, Any]]:
+        """Read a schema sidecar, ignoring it unless it matches the file version"""
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if tuple(meta.get("version") or ()) != version:
+            return None
+        return meta.get("schema")
+
+    @staticmethod
+    def _write_schema_meta(meta_path: Path, version: Tuple[int, ...], schema_info: Dict[str, Any]):
+        """Best-effort write of a schema sidecar"""
+        try:
+            meta_path.write_text(
+                json.dumps({"version": list(version), "schema": schema_info}, default=str),
+                encoding="utf-8",
+            )
+        except OSError:
+            pass
+
+    def invalidate_schema(self, user_id: str, dataset_id: str):
+        """Drop the cached schema for a dataset (call after any ingest/delete)"""
+        self._schema_cache.pop(f"{user_id}:{dataset_id}", None)
+        self.get_schema_meta_path(user_id, dataset_id).unlink(missing_ok=True)
+        # Cached result rows are derived from the same file
+        for key in [k for k in self._result_cache if k[:2] == (user_id, dataset_id)]:
+            del self._result_cache[key]
+
+    async def refresh_schema(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
+        """Re-read the schema after an ingest so the next query starts warm"""
+        self.invalidate_schema(user_id, dataset_id)
+        return await self.get_schema(user_id, dataset_id)
+
     async def get_schema(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
         """
         Get database schema information
+
+        Results are cached per (user_id, dataset_id) and invalidated when the
+        database file changes on disk, when the TTL expires, or explicitly via
+        invalidate_schema(). A sidecar file (<db>.meta.json) keeps the schema
+        and its fingerprint across restarts, so a cold cache does not need to
+        re-inspect SQLite either.
+
+        The returned dict includes a "fingerprint" key: a stable hash of the
+        schema, used for prompt and response cache keys.
         
         Args:
             user_id: User identifier
@@ -122,64 +478,84 @@ class DatabaseManager:
                 f"Database file not found: {db_path}. "
                 f"Please ensure the dataset '{dataset_id}' has been imported."
             )
-        
-        engine = await self.get_engine(user_id, dataset_id)
-        
+
+        cache_key = f"{user_id}:{dataset_id}"
+        cached = self._schema_cache.get(cache_key)
+        if cached is not None:
+            cached_version, expires_at, cached_schema = cached
+            if cached_version == self._schema_version(db_path) and expires_at > time.monotonic():
+                self._schema_cache.move_to_end(cache_key)
+                return copy.deepcopy(cached_schema)
+            del self._schema_cache[cache_key]
+
+        meta_path = self.get_schema_meta_path(user_id, dataset_id)
+        sidecar_version = await asyncio.to_thread(self._sidecar_version, db_path)
+        schema_info = None
+        if sidecar_version is not None:
+            schema_info = self._read_schema_meta(meta_path, sidecar_version)
+        if schema_info is None:
+            schema_info = await self._load_schema(user_id, dataset_id)
+            schema_info["fingerprint"] = fingerprint(schema_info)
+            # Stamp after loading: the first pooled connection switches the
+            # file to WAL, which itself touches the file.
+            sidecar_version = await asyncio.to_thread(self._sidecar_version, db_path)
+            if sidecar_version is not None:
+                self._write_schema_meta(meta_path, sidecar_version, schema_info)
+
+        self._schema_cache[cache_key] = (
+            self._schema_version(db_path),
+            time.monotonic() + self.SCHEMA_CACHE_TTL_SECONDS,
+            schema_info,
+        )
+        while len(self._schema_cache) > self.SCHEMA_CACHE_MAX_ENTRIES:
+            self._schema_cache.popitem(last=False)
+
+        return copy.deepcopy(schema_info)
+
+    async def _load_schema(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
+        """Read schema information (tables, columns, sample rows) from SQLite"""
         schema_info = {
             "tables": []
         }
         
-        # Get all table names using SQLite system tables
-        async with engine.begin() as conn:
-            # Query SQLite master table for table names
+        async with self.acquire(user_id, dataset_id) as conn:
+            # Tables and their columns in one query via the table-valued
+            # pragma_table_info() (SQLite >= 3.16)
             result = await conn.execute(text("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name NOT LIKE 'sqlite_%'
-                ORDER BY name
+                SELECT m.name, p.name, p.type, p."notnull"
+                FROM sqlite_master AS m
+                JOIN pragma_table_info(m.name) AS p
+                WHERE m.type='table' AND m.name NOT LIKE 'sqlite_%'
+                ORDER BY m.name, p.cid
             """))
-            table_rows = result.fetchall()
-            table_names = [row[0] for row in table_rows]
-        
-        for table_name in table_names:
-            # Get column information using PRAGMA
-            async with engine.begin() as conn:
-                result = await conn.execute(text(f"PRAGMA table_info({table_name})"))
-                column_rows = result.fetchall()
-                
-                table_info = {
-                    "name": table_name,
-                    "columns": []
-                }
-                
-                for col_row in column_rows:
-                    # PRAGMA table_info returns: cid, name, type, notnull, dflt_value, pk
-                    col_name = col_row[1]
-                    col_type = col_row[2]
-                    not_null = col_row[3] == 1
-                    
-                    table_info["columns"].append({
-                        "name": col_name,
-                        "type": col_type,
-                        "nullable": not not_null
-                    })
-                
-                # Get sample data (first 3 rows)
+            
+            tables: Dict[str, Dict[str, Any]] = {}
+            for table_name, col_name, col_type, not_null in result.fetchall():
+                table_info = tables.setdefault(
+                    table_name, {"name": table_name, "columns": []}
+                )
+                table_info["columns"].append({
+                    "name": col_name,
+                    "type": col_type,
+                    "nullable": not_null != 1
+                })
+            
+            # Sample data (first 3 rows) per table, on the same connection
+            for table_name, table_info in tables.items():
+                quoted = '"' + table_name.replace('"', '""') + '"'
                 try:
                     sample_result = await conn.execute(
-                        text(f"SELECT * FROM {table_name} LIMIT 3")
+                        text(f"SELECT * FROM {quoted} LIMIT 3")
                     )
                     sample_rows = sample_result.fetchall()
-                    if sample_rows:
-                        columns = sample_result.keys()
-                        table_info["sample_rows"] = [
-                            dict(zip(columns, row)) for row in sample_rows
-                        ]
-                    else:
-                        table_info["sample_rows"] = []
+                    columns = sample_result.keys()
+                    table_info["sample_rows"] = [
+                        dict(zip(columns, row)) for row in sample_rows
+                    ]
                 except Exception:
                     table_info["sample_rows"] = []
-            
-            schema_info["tables"].append(table_info)
+                
+                schema_info["tables"].append(table_info)
         
         return schema_info
     
@@ -201,6 +577,9 @@ class DatabaseManager:
         for engine in self.connections.values():
             await engine.dispose()
         self.connections.clear()
+        self._engine_last_used.clear()
+        if self._disposals:
+            await asyncio.gather(*self._disposals, return_exceptions=True)
 
 
 # Global database manager instance
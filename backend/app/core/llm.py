@@ -1,71 +1,244 @@
 """LLM client wrapper for OpenAI"""
 import json
-from typing import Dict, Any, Optional
-from openai import OpenAI
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, Optional, Type
+import httpx
+from openai import AsyncOpenAI, BadRequestError, DefaultAsyncHttpxClient
+from pydantic import BaseModel
 from app.config import settings
 
 
+# Keep enough idle connections for a full batch of concurrent calls, and keep
+# them well past httpx's 5s default so sporadic queries skip the TLS handshake
+LLM_HTTP_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=settings.llm_concurrency,
+    keepalive_expiry=120.0,
+)
+
+
+@lru_cache(maxsize=None)
+def _json_schema_format(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Strict structured-output response_format for a pydantic model"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.__name__,
+            "schema": schema.model_json_schema(),
+            "strict": True,
+        },
+    }
+
+
+class _JsonObjectScanner:
+    """
+    Track brace depth over a streamed JSON object.
+
+    Braces inside string literals are ignored, so the scanner can tell when
+    the top-level object has closed without parsing the partial text.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """Consume a chunk; return the index just past the closing brace, if reached"""
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
+
+
 class LLMClient:
     """Wrapper for OpenAI API"""
-    
+
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=DefaultAsyncHttpxClient(limits=LLM_HTTP_LIMITS),
+        )
         self.model = settings.openai_model
-    
+        # Cleared the first time the model rejects json_schema response formats
+        self.structured_outputs = True
+
+    def _request_kwargs(
+        self,
+        messages: list[Dict[str, str]],
+        temperature: float,
+        response_format: Optional[Dict[str, str]],
+        prompt_cache_key: Optional[str],
+        max_tokens: Optional[int],
+    ) -> Dict[str, Any]:
+        """Build chat completion arguments shared by plain and streamed calls"""
+        kwargs: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+        }
+
+        # Some models (like gpt-5-nano) only support default temperature (1)
+        # and count hidden reasoning toward the token cap, so skip both there
+        if 'nano' not in self.model.lower():
+            kwargs["temperature"] = temperature
+            if max_tokens:
+                kwargs["max_completion_tokens"] = max_tokens
+
+        if response_format:
+            kwargs["response_format"] = response_format
+
+        if prompt_cache_key:
+            kwargs["extra_body"] = {"prompt_cache_key": prompt_cache_key}
+
+        return kwargs
+
     async def chat_completion(
         self,
         messages: list[Dict[str, str]],
         temperature: float = 0.3,
-        response_format: Optional[Dict[str, str]] = None
+        response_format: Optional[Dict[str, str]] = None,
+        prompt_cache_key: Optional[str] = None,
+        max_tokens: Optional[int] = None,
     ) -> str:
         """
         Make a chat completion request
-        
+
         Args:
             messages: List of message dicts with 'role' and 'content'
             temperature: Sampling temperature (0-2)
             response_format: Optional JSON schema for structured output
-            
+            prompt_cache_key: Optional routing hint so requests sharing a
+                static prompt prefix land on the same prompt cache
+            max_tokens: Optional cap on generated tokens
+
         Returns:
             Response content as string
         """
         try:
-            kwargs = {
-                "model": self.model,
-                "messages": messages,
-            }
-            
-            # Some models (like gpt-5-nano) only support default temperature (1)
-            # Check if model name contains 'nano' and skip temperature parameter
-            if 'nano' not in self.model.lower():
-                kwargs["temperature"] = temperature
-            
-            if response_format:
-                kwargs["response_format"] = response_format
-            
-            response = self.client.chat.completions.create(**kwargs)
+            kwargs = self._request_kwargs(
+                messages, temperature, response_format, prompt_cache_key, max_tokens
+            )
+            response = await self.client.chat.completions.create(**kwargs)
             return response.choices[0].message.content
         except Exception as e:
             raise Exception(f"LLM API error: {str(e)}")
-    
+
+    async def stream_chat_completion(
+        self,
+        messages: list[Dict[str, str]],
+        temperature: float = 0.3,
+        response_format: Optional[Dict[str, str]] = None,
+        prompt_cache_key: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion as content deltas
+
+        Closing the generator early closes the HTTP stream, which stops
+        generation (and billing) on the server.
+        """
+        try:
+            kwargs = self._request_kwargs(
+                messages, temperature, response_format, prompt_cache_key, max_tokens
+            )
+            stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        except BadRequestError:
+            raise
+        except Exception as e:
+            raise Exception(f"LLM API error: {str(e)}")
+
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
     async def generate_json(
         self,
         messages: list[Dict[str, str]],
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        prompt_cache_key: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        schema: Optional[Type[BaseModel]] = None,
     ) -> Dict[str, Any]:
         """
         Generate and parse JSON response
-        
+
+        With a schema the provider enforces the output shape (structured
+        outputs). Models without json_schema support fall back to plain JSON
+        mode, and the client remembers that for later calls.
+
         Args:
             messages: List of message dicts
             temperature: Sampling temperature
-            
+            prompt_cache_key: Optional prompt cache routing hint
+            max_tokens: Optional cap on generated tokens
+            schema: Optional pydantic model describing the expected object
+
         Returns:
             Parsed JSON as dict
         """
-        response_format = {"type": "json_object"}
-        response = await self.chat_completion(messages, temperature, response_format)
-        
+        if schema is not None and self.structured_outputs:
+            try:
+                return await self._stream_json(
+                    messages, temperature, _json_schema_format(schema), prompt_cache_key, max_tokens
+                )
+            except BadRequestError as e:
+                if "response_format" not in str(e):
+                    raise
+                self.structured_outputs = False
+
+        return await self._stream_json(
+            messages, temperature, {"type": "json_object"}, prompt_cache_key, max_tokens
+        )
+
+    async def _stream_json(
+        self,
+        messages: list[Dict[str, str]],
+        temperature: float,
+        response_format: Dict[str, Any],
+        prompt_cache_key: Optional[str],
+        max_tokens: Optional[int],
+    ) -> Dict[str, Any]:
+        """
+        Stream a JSON completion and parse it
+
+        The stream is dropped as soon as the top-level object closes, so
+        trailing whitespace some models emit in JSON mode never delays the
+        caller.
+        """
+        scanner = _JsonObjectScanner()
+        parts: list[str] = []
+        stream = self.stream_chat_completion(
+            messages, temperature, response_format, prompt_cache_key, max_tokens
+        )
+        try:
+            async for delta in stream:
+                end = scanner.feed(delta)
+                if end is not None:
+                    parts.append(delta[:end])
+                    break
+                parts.append(delta)
+        finally:
+            await stream.aclose()
+        response = "".join(parts)
+
         try:
             return json.loads(response)
         except json.JSONDecodeError:
@@ -75,4 +248,3 @@ class LLMClient:
             if json_match:
                 return json.loads(json_match.group())
             raise Exception("Failed to parse JSON response from LLM")
-
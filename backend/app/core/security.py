@@ -1,6 +1,7 @@
 """SQL query validation and security"""
 import re
-from typing import Tuple, List
+from functools import lru_cache
+from typing import Tuple, List, Optional
 from sqlalchemy import text
 
 
@@ -21,6 +22,16 @@ class SQLValidator:
         'COUNT', 'SUM', 'AVG', 'MAX', 'MIN', 'CASE', 'WHEN', 'THEN',
         'AND', 'OR', 'NOT', 'IN', 'LIKE', 'BETWEEN', 'IS NULL', 'IS NOT NULL'
     ]
+
+    # Patterns compiled once; the keyword check is a single alternation scan
+    # instead of one search per keyword.
+    _DANGER_RE = re.compile(r'\b(?:' + '|'.join(map(re.escape, DANGEROUS_KEYWORDS)) + r')\b')
+    # Matched against the upper-cased SQL, so no IGNORECASE needed
+    _PRAGMA_TABLE_RE = re.compile(r'PRAGMA_TABLE_INFO\s*\(\s*[\'"]?(\w+)[\'"]?\s*\)')
+    _TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)')
+    _FROM_VALUES_RE = re.compile(r'\bFROM\s*\(\s*VALUES\b')
+    _LINE_COMMENT_RE = re.compile(r'--.*$', re.MULTILINE)
+    _BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
     
     @classmethod
     def validate_sql(cls, sql: str, allowed_tables: List[str] = None) -> Tuple[bool, str]:
@@ -34,14 +45,21 @@ class SQLValidator:
         Returns:
             Tuple of (is_valid, error_message)
         """
+        # Validation is deterministic, so identical (sql, tables) pairs are
+        # memoized; the table list is order-insensitive.
+        tables_key = tuple(sorted(allowed_tables)) if allowed_tables else None
+        return cls._validate(sql, tables_key)
+
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _validate(cls, sql: str, allowed_tables: Optional[Tuple[str, ...]]) -> Tuple[bool, str]:
+        """Uncached validation; see validate_sql"""
         sql_upper = sql.upper().strip()
         
-        # Check for dangerous keywords
-        for keyword in cls.DANGEROUS_KEYWORDS:
-            # Use word boundaries to avoid false positives
-            pattern = r'\b' + re.escape(keyword) + r'\b'
-            if re.search(pattern, sql_upper):
-                return False, f"Dangerous keyword '{keyword}' is not allowed. Only SELECT queries are permitted."
+        # Check for dangerous keywords (word boundaries avoid false positives)
+        match = cls._DANGER_RE.search(sql_upper)
+        if match:
+            return False, f"Dangerous keyword '{match.group(0)}' is not allowed. Only SELECT queries are permitted."
         
         # Must start with SELECT
         if not sql_upper.startswith('SELECT'):
@@ -49,26 +67,26 @@ class SQLValidator:
         
         # Check for table names if provided
         if allowed_tables:
+            # sql_upper is already upper-cased, so matches below need no .upper()
+            allowed = frozenset(t.upper() for t in allowed_tables)
+
             # First, handle PRAGMA table_info() queries - extract table name from function call
             # Pattern: FROM pragma_table_info('table_name') or FROM pragma_table_info("table_name")
-            pragma_pattern = r'PRAGMA_TABLE_INFO\s*\(\s*[\'"]?(\w+)[\'"]?\s*\)'
-            pragma_matches = re.findall(pragma_pattern, sql_upper, re.IGNORECASE)
+            pragma_matches = cls._PRAGMA_TABLE_RE.findall(sql_upper)
             for pragma_table in pragma_matches:
-                if pragma_table.upper() not in [t.upper() for t in allowed_tables]:
+                if pragma_table not in allowed:
                     return False, f"PRAGMA table_info() is querying table '{pragma_table}' which is not allowed or does not exist."
             
             # Extract regular table names from FROM and JOIN clauses
             # Exclude PRAGMA functions by checking if FROM is followed by PRAGMA
             # Pattern matches: FROM table_name (but we'll filter out PRAGMA functions)
-            table_pattern = r'\bFROM\s+(\w+)|JOIN\s+(\w+)'
-            matches = re.findall(table_pattern, sql_upper)
-            found_tables = [m[0] or m[1] for m in matches if m[0] or m[1]]
+            found_tables = cls._TABLE_RE.findall(sql_upper)
             
             for table in found_tables:
                 # Skip PRAGMA functions - they're table-valued functions, not actual tables
-                if 'PRAGMA' in table.upper() or table.upper().startswith('PRAGMA_'):
+                if 'PRAGMA' in table:
                     continue
-                if table.upper() not in [t.upper() for t in allowed_tables]:
+                if table not in allowed:
                     return False, f"Table '{table}' is not allowed or does not exist."
         
         # Basic syntax check - ensure balanced parentheses
@@ -77,13 +95,9 @@ class SQLValidator:
         
         # Check for PostgreSQL/MySQL-specific syntax that SQLite doesn't support
         # Check for FROM (VALUES ...) pattern (PostgreSQL syntax)
-        if re.search(r'\bFROM\s*\(\s*VALUES\b', sql_upper, re.IGNORECASE):
+        if cls._FROM_VALUES_RE.search(sql_upper):
             return False, "SQLite does not support 'FROM (VALUES ...)' syntax. Use actual table names or PRAGMA table_info() for column listings."
         
-        # Check for VALUES clause in FROM (should use actual tables)
-        if re.search(r'\bFROM\s*\(\s*VALUES\s*\(', sql_upper, re.IGNORECASE):
-            return False, "SQLite does not support VALUES in FROM clause. Query actual tables from the schema."
-        
         return True, ""
     
     @classmethod
@@ -98,8 +112,8 @@ class SQLValidator:
             Sanitized SQL query
         """
         # Remove SQL comments
-        sql = re.sub(r'--.*$', '', sql, flags=re.MULTILINE)
-        sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+        sql = cls._LINE_COMMENT_RE.sub('', sql)
+        sql = cls._BLOCK_COMMENT_RE.sub('', sql)
         
         # Normalize whitespace
         sql = ' '.join(sql.split())
@@ -0,0 +1,31 @@
+"""Shared per-process service instances for route dependencies"""
+from functools import lru_cache
+
+from app.core.llm import LLMClient
+from app.services.analysis_service import AnalysisService
+from app.services.data_analysis_service import DataAnalysisService
+from app.services.query_service import QueryService
+
+
+@lru_cache
+def get_llm_client() -> LLMClient:
+    """OpenAI client shared by every service (one HTTP connection pool)"""
+    return LLMClient()
+
+
+@lru_cache
+def get_query_service() -> QueryService:
+    """Playbook planner, created on first use"""
+    return QueryService(llm=get_llm_client())
+
+
+@lru_cache
+def get_analysis_service() -> AnalysisService:
+    """Narrative generator, created on first use"""
+    return AnalysisService(llm=get_llm_client())
+
+
+@lru_cache
+def get_data_analysis_service() -> DataAnalysisService:
+    """Result structure analyzer, created on first use"""
+    return DataAnalysisService()
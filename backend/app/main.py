@@ -1,13 +1,16 @@
 """FastAPI application entry point"""
 import logging
+import mmap
 from pathlib import Path
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.config import settings
 from app.api.routes import query, datasets, schema, auth
+from app.core.auth import init_auth_db
+from app.core.cache import RESPONSE_CACHE_PATH, cache_enabled, response_cache
 from app.core.database import db_manager
 from app.utils.csv_importer import CSVImporter
 
@@ -23,7 +26,9 @@ app = FastAPI(
     title="SpeakInsights API",
     description="Prompt-driven data analytics platform",
     version="1.0.0",
-    debug=settings.debug
+    debug=settings.debug,
+    # orjson encodes the large results payloads several times faster than json
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware - MUST be added before other middleware
@@ -44,32 +49,34 @@ app.include_router(schema.router, prefix="/api/v1", tags=["schema"])
 
 
 # Exception handlers to ensure CORS headers are always included
+def _cors_headers_for(origin: str) -> dict:
+    """CORS headers allowing a single origin"""
+    return {
+        "Access-Control-Allow-Origin": origin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "*",
+        "Access-Control-Allow-Headers": "*",
+    }
+
+
+# Header dicts are built once per allowed origin; unknown origins fall back
+# to the first allowed origin.
+CORS_HEADERS_BY_ORIGIN = {origin: _cors_headers_for(origin) for origin in settings.cors_origins}
+DEFAULT_CORS_HEADERS = (
+    CORS_HEADERS_BY_ORIGIN[settings.cors_origins[0]] if settings.cors_origins else {}
+)
+
+
 def get_cors_headers(request: Request) -> dict:
     """Get CORS headers based on request origin"""
     origin = request.headers.get("origin")
-    # Check if origin is in allowed origins
-    if origin and origin in settings.cors_origins:
-        return {
-            "Access-Control-Allow-Origin": origin,
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "*",
-            "Access-Control-Allow-Headers": "*",
-        }
-    # Fallback to first allowed origin if origin doesn't match
-    elif settings.cors_origins:
-        return {
-            "Access-Control-Allow-Origin": settings.cors_origins[0] if isinstance(settings.cors_origins, list) else str(settings.cors_origins).split(",")[0].strip(),
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "*",
-            "Access-Control-Allow-Headers": "*",
-        }
-    return {}
+    return CORS_HEADERS_BY_ORIGIN.get(origin, DEFAULT_CORS_HEADERS)
 
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     """Handle HTTP exceptions with CORS headers"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
         headers=get_cors_headers(request)
@@ -79,7 +86,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle validation errors with CORS headers"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={"detail": exc.errors()},
         headers=get_cors_headers(request)
@@ -90,7 +97,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle all other exceptions with CORS headers"""
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": f"Internal server error: {str(exc)}"},
         headers=get_cors_headers(request)
@@ -99,9 +106,19 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize MVP dataset on startup if it doesn't exist"""
+    """Initialize the auth database, and the MVP dataset if it doesn't exist"""
     # Log CORS configuration
     logger.info(f"CORS allowed origins: {settings.cors_origins}")
+
+    # Users table DDL runs once here rather than on each auth call
+    init_auth_db()
+
+    # Plans and narratives cached by the previous process are still valid:
+    # their keys include the schema/data fingerprints they were built from
+    if settings.response_cache_persist and cache_enabled():
+        restored = response_cache.load(RESPONSE_CACHE_PATH)
+        if restored:
+            logger.info(f"Restored {restored} cached responses from {RESPONSE_CACHE_PATH}")
     
     user_id = "default_user"
     dataset_id = "mvp_dataset"
@@ -132,21 +149,22 @@ async def startup_event():
                 await db_manager.create_database(user_id, dataset_id)
                 engine = await db_manager.get_engine(user_id, dataset_id)
                 
-                with open(csv_file, 'rb') as f:
-                    csv_content = f.read()
-                
-                result = await CSVImporter.import_csv(
-                    engine,
-                    csv_content,
-                    table_name="diabetes",
-                    encoding='utf-8'
-                )
+                # Map the file instead of reading it into a bytes copy
+                with open(csv_file, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as csv_content:
+                    result = await CSVImporter.import_csv(
+                        engine,
+                        csv_content,
+                        table_name="diabetes",
+                        encoding='utf-8'
+                    )
                 
                 logger.info(
                     f"Successfully imported MVP dataset: "
                     f"{result['rows_imported']} rows into table '{result['table_name']}'"
                 )
                 await engine.dispose()
+                await db_manager.refresh_schema(user_id, dataset_id)
             except Exception as e:
                 logger.error(f"Failed to import MVP dataset: {str(e)}")
                 logger.exception(e)
@@ -160,6 +178,14 @@ async def startup_event():
         logger.info(f"MVP dataset found at {db_path}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist the response cache for the next process"""
+    if settings.response_cache_persist and cache_enabled():
+        RESPONSE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        response_cache.save(RESPONSE_CACHE_PATH)
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
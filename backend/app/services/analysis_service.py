@@ -1,13 +1,78 @@
 """Analysis service: Generate textual insights"""
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+from app.config import settings
+from app.core.cache import cache_enabled, fingerprint, make_cache_key, normalize_query, response_cache
 from app.core.llm import LLMClient
 
 
+INSIGHTS_SYSTEM_PROMPT = """You are a data analyst explaining data to a non-technical business user.
+The next message has their question and a summary of the data and analysis.
+Never mention SQL, queries, tables, columns, or code. Use plain, friendly business language.
+Round numbers to at most 2 decimals; prefer percentages and simple ranges.
+
+Reply with JSON:
+{"summary": "2-3 sentences on the key findings",
+ "key_findings": ["3-5 notable patterns or numbers"],
+ "patterns": ["anomalies or notable patterns, if any"],
+ "recommendations": ["0-2 actionable insights"],
+ "follow_ups": ["2-4 follow-up questions"]}
+
+Follow-ups: short direct questions the user can paste back ("Show", "Give me", "Compare", "Explore"; not "Would you like"), answerable from this dataset alone, e.g.
+- "Show which numeric features are most related to the main outcome in this dataset."
+- "Compare two important groups in this dataset on a key metric, such as outcome rate or row count."
+"""
+
+
+class InsightsSchema(BaseModel):
+    """Shape of the narrative the model must return (enforced via structured outputs)"""
+
+    model_config = ConfigDict(extra="forbid")
+
+    summary: str
+    key_findings: List[str]
+    patterns: List[str]
+    recommendations: List[str]
+    follow_ups: List[str]
+
+
+INSIGHTS_SYSTEM_MESSAGE = {"role": "system", "content": INSIGHTS_SYSTEM_PROMPT}
+
+# The narrative prefix is identical for every dataset, so all requests share one routing key
+INSIGHTS_PROMPT_CACHE_KEY = "speakinsights:insights"
+
+# Suggested when the model returns no usable follow-up questions
+DEFAULT_FOLLOW_UPS = (
+    "Give me a high-level overview of this dataset, including numeric ranges and missing values.",
+    "Show which numeric features are most related to the main outcome or target in this dataset.",
+    "Show the distribution of an important numeric feature in this dataset (for example, glucose, BMI, or age).",
+    "Compare two important groups in this dataset on a key metric, such as outcome rate or row count.",
+)
+
+# Five short sections need far less; the cap only bounds runaway generations
+INSIGHTS_MAX_TOKENS = 800
+
+# Shared across batches so concurrent requests together stay under the limit
+_llm_semaphore = asyncio.Semaphore(settings.llm_concurrency)
+
+
+def _format_cell(value: Any) -> str:
+    """Render a sample value compactly for the prompt table"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return str(round(value, 2))
+    return str(value)
+
+
 class AnalysisService:
     """Service for generating textual analysis and insights"""
     
-    def __init__(self):
-        self.llm = LLMClient()
+    def __init__(self, llm: Optional[LLMClient] = None):
+        self.llm = llm or LLMClient()
     
     async def generate_insights(
         self,
@@ -17,6 +82,7 @@ class AnalysisService:
         data_structure: Dict[str, Any],
         visualization: Dict[str, Any],
         extra_visualizations: List[Dict[str, Any]] | None = None,
+        use_cache: bool = True,
     ) -> Dict[str, Any]:
         """
         Generate textual analysis of query results
@@ -26,10 +92,15 @@ class AnalysisService:
             query_results: Query results
             sql: Executed SQL query
             data_structure: Data structure analysis
+            use_cache: Reuse a previous narrative for identical inputs
             
         Returns:
             Textual analysis with summary, findings, and insights
         """
+        # Nothing to narrate; the fallback says as much without an LLM call
+        if not query_results:
+            return self._generate_fallback_analysis(query_results, data_structure)
+
         # Prepare results + visualization summary for LLM
         results_summary = self._prepare_results_summary(
             query_results,
@@ -38,60 +109,42 @@ class AnalysisService:
             extra_visualizations or [],
         )
         
-        prompt = f"""You are helping a non-technical business user understand their data.
-The user will never see any mention of SQL, queries, or technical implementation details.
-Speak in clear, friendly business language.
-
-User Question: "{user_query}"
-
-Data + Analysis Summary:
-{results_summary}
-
-Please provide a concise, easy-to-understand analysis with:
-1. Executive summary (2-3 sentences describing the key findings)
-2. Key findings (3-5 bullet points highlighting important patterns or numbers)
-3. Notable patterns or anomalies (if any)
-4. Recommendations (if applicable, 1-2 actionable insights)
-5. 2-4 follow-up questions the user could ask next to go deeper.
-
-Follow-up question rules:
-- Each follow-up must be a short, direct question the user can paste back into the assistant.
-- Use imperative or direct wording like "Show", "Give me", "Compare", or "Explore" instead of "Would you like".
-- Only suggest follow-ups the system can actually handle, for example:
-  * "Give me a high-level overview of this dataset, including numeric ranges and missing values."
-  * "Show which numeric features are most related to the main outcome or target in this dataset."
-  * "Show the distribution of an important numeric feature in this dataset (such as glucose, BMI, or age)."
-  * "Compare two important groups in this dataset on a key metric, such as outcome rate or row count."
-  * "Show a breakdown of the main outcome or target across the dataset."
-- Do not suggest follow-ups that require external data, advanced modeling, or actions outside this dataset.
-
-Formatting rules:
-- Do NOT mention SQL, queries, tables, columns, or code.
-- When you mention numbers, round them to at most 2 decimal places.
-- Prefer percentages and simple ranges over raw long decimals.
-
-Return JSON format only:
-{{
-  "summary": "Executive summary text",
-  "key_findings": ["finding 1", "finding 2", ...],
-  "patterns": ["pattern 1", "pattern 2", ...],
-  "recommendations": ["recommendation 1", ...],
-  "follow_ups": ["follow-up question 1", "follow-up question 2", ...]
-}}"""
+        # The LLM only sees the question and the summary, so key on exactly
+        # that: differently worded SQL or full result sets that summarize the
+        # same way share a narrative, and near-identical phrasings of the
+        # question (case, spacing) hit the same entry.
+        use_cache = cache_enabled(use_cache)
+        if use_cache:
+            cache_key = make_cache_key(
+                "insights",
+                normalize_query(user_query),
+                fingerprint(results_summary),
+            )
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
+        # Static instructions first, per-request data last, so the shared
+        # prefix is eligible for provider-side prompt caching.
         messages = [
-            {
-                "role": "system",
-                "content": "You are a data analyst expert. Analyze query results and provide clear, actionable insights. Always return valid JSON."
-            },
+            INSIGHTS_SYSTEM_MESSAGE,
             {
                 "role": "user",
-                "content": prompt
-            }
+                "content": (
+                    f'User Question: "{user_query}"\n\n'
+                    f"Data + Analysis Summary:\n{results_summary}"
+                ),
+            },
         ]
-        
+
         try:
-            response = await self.llm.generate_json(messages, temperature=0.5)
+            response = await self.llm.generate_json(
+                messages,
+                temperature=0.0,
+                prompt_cache_key=INSIGHTS_PROMPT_CACHE_KEY,
+                max_tokens=INSIGHTS_MAX_TOKENS,
+                schema=InsightsSchema,
+            )
 
             raw_follow_ups = response.get("follow_ups") or []
             follow_ups: List[str] = [
@@ -99,14 +152,9 @@ Return JSON format only:
             ]
 
             if not follow_ups:
-                follow_ups = [
-                    "Give me a high-level overview of this dataset, including numeric ranges and missing values.",
-                    "Show which numeric features are most related to the main outcome or target in this dataset.",
-                    "Show the distribution of an important numeric feature in this dataset (for example, glucose, BMI, or age).",
-                    "Compare two important groups in this dataset on a key metric, such as outcome rate or row count.",
-                ]
-
-            return {
+                follow_ups = list(DEFAULT_FOLLOW_UPS)
+
+            insights = {
                 "summary": response.get("summary", ""),
                 "key_findings": response.get("key_findings", []),
                 "patterns": response.get("patterns", []),
@@ -114,9 +162,39 @@ Return JSON format only:
                 "follow_ups": follow_ups,
             }
         except Exception as e:
-            # Fallback to basic analysis if LLM fails
+            # Fallback to basic analysis if LLM fails (never cached)
             return self._generate_fallback_analysis(query_results, data_structure)
+
+        if use_cache:
+            response_cache.set(cache_key, insights)
+
+        return insights
     
+    async def generate_insights_batch(
+        self,
+        inputs: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate insights for several result sets concurrently
+
+        Args:
+            inputs: One dict of generate_insights keyword arguments per result set
+
+        Returns:
+            Insights in the same order as inputs; a failed slot gets the fallback analysis
+        """
+        async def run(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+            async with _llm_semaphore:
+                return await self.generate_insights(**kwargs)
+
+        outcomes = await asyncio.gather(*(run(kwargs) for kwargs in inputs), return_exceptions=True)
+        return [
+            self._generate_fallback_analysis(kwargs["query_results"], kwargs["data_structure"])
+            if isinstance(outcome, Exception)
+            else outcome
+            for kwargs, outcome in zip(inputs, outcomes)
+        ]
+
     def _prepare_results_summary(
         self,
         results: List[Dict[str, Any]],
@@ -144,19 +222,31 @@ Return JSON format only:
         if v_x or v_y:
             summary_parts.append(f"- axes: x={v_x}, y={v_y}")
 
-        # Mention any extra visualizations
-        if extra_visualizations:
-            summary_parts.append(f"\nAdditional visualizations ({len(extra_visualizations)}):")
-            for extra in extra_visualizations:
-                e_type = extra.get("type")
-                e_cfg = extra.get("config", {}) or {}
-                e_title = e_cfg.get("title")
-                summary_parts.append(f"- {e_type}: {e_title}")
+        # Mention any extra visualizations, skipping ones that repeat a chart
+        # already described (same type and title up to case/spacing)
+        seen = {(v_type, normalize_query(str(v_title or "")))}
+        extra_lines: List[str] = []
+        for extra in extra_visualizations:
+            e_type = extra.get("type")
+            e_cfg = extra.get("config", {}) or {}
+            e_title = e_cfg.get("title")
+            key = (e_type, normalize_query(str(e_title or "")))
+            if key in seen:
+                continue
+            seen.add(key)
+            extra_lines.append(f"- {e_type}: {e_title}")
+        if extra_lines:
+            summary_parts.append(f"\nAdditional visualizations ({len(extra_lines)}):")
+            summary_parts.extend(extra_lines)
 
-        # Add sample data
+        # Add sample data as a table: headers once, then one line of values per row
+        columns = list(data_structure.get("columns", {})) or list(results[0])
         summary_parts.append("\nSample data (first 5 rows):")
-        for i, row in enumerate(results[:5], 1):
-            summary_parts.append(f"Row {i}: {row}")
+        summary_parts.append("| " + " | ".join(columns) + " |")
+        summary_parts.extend(
+            "| " + " | ".join(_format_cell(row.get(col)) for col in columns) + " |"
+            for row in results[:5]
+        )
 
         # Add statistics for numeric columns
         numeric_cols = data_structure.get("numeric_columns", [])
@@ -200,6 +290,9 @@ Return JSON format only:
             corr = data_structure.get("correlation")
             pts = data_structure.get("point_count")
             summary_parts.append(f"\nRelationship between {fx} and {fy}: correlation={corr}, points={pts}")
+            plotted = data_structure.get("plotted_points")
+            if plotted:
+                summary_parts.append(f"Scatter chart shows an evenly spaced sample of {plotted} points")
         elif kind == "segmented_distribution":
             feature = data_structure.get("feature")
             seg_col = data_structure.get("segment_column")
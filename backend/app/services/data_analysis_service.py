@@ -1,5 +1,5 @@
 """Data analysis service: Analyze query result structure"""
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import pandas as pd
 from datetime import datetime
 
@@ -60,12 +60,17 @@ class DataAnalysisService:
         
         return "text"
     
-    def analyze_structure(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def analyze_structure(
+        self,
+        results: List[Dict[str, Any]],
+        df: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
         """
         Analyze query result structure
         
         Args:
             results: List of result rows as dictionaries
+            df: DataFrame already built from results, if the caller has one
             
         Returns:
             Data structure analysis
@@ -84,7 +89,8 @@ class DataAnalysisService:
             }
         
         # Convert to DataFrame for easier analysis
-        df = pd.DataFrame(results)
+        if df is None:
+            df = pd.DataFrame(results)
         
         analysis = {
             "row_count": len(df),
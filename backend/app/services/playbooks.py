@@ -1,37 +1,133 @@
 """Analysis playbooks for common question types."""
-from typing import Dict, Any, List, Optional
+import base64
+import functools
+import hashlib
+import warnings
+from functools import cached_property
+from typing import Callable, Dict, Any, List, Optional, Union
 import pandas as pd
 import numpy as np
 
+from app.core.cache import ObjectCache, cache_enabled, make_cache_key
 
-def overview_playbook(df: pd.DataFrame) -> Dict[str, Any]:
+
+# Whole-frame playbook outputs keyed by frame contents; follow-up questions on
+# an unchanged dataset fetch the same rows and reuse these. Kept as objects,
+# not JSON, so NaN statistics survive a hit unchanged.
+_playbook_cache = ObjectCache(max_entries=64, ttl_seconds=3600)
+
+# Below this many matrix elements the float64 GEMM is already sub-millisecond
+FLOAT32_GEMM_MIN_ELEMENTS = 1_000_000
+
+# Scatter charts are downsampled past this many points to keep payloads small
+SCATTER_MAX_POINTS = 5000
+
+# Correlation metadata omits the full matrix for frames wider than this
+CORRELATION_MATRIX_MAX_COLUMNS = 200
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame's values, index, column names and dtypes"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr(list(zip(df.columns, map(str, df.dtypes)))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PreparedFrame:
+    """
+    A DataFrame plus derived views shared by every playbook run on it.
+
+    Build one per request and pass it to each playbook so the numeric column
+    subset and the content fingerprint are computed once. Playbooks accept a
+    plain DataFrame too. The views are read-only by convention.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    @cached_property
+    def numeric_df(self) -> pd.DataFrame:
+        return self.df.select_dtypes(include="number")
+
+    @cached_property
+    def fingerprint(self) -> str:
+        return frame_fingerprint(self.df)
+
+
+FrameLike = Union[pd.DataFrame, PreparedFrame]
+
+
+def _prepared(data: FrameLike) -> PreparedFrame:
+    """Wrap a plain DataFrame; pass a PreparedFrame through unchanged"""
+    return data if isinstance(data, PreparedFrame) else PreparedFrame(data)
+
+
+def _cached_by_frame(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """Memoize a playbook on (frame fingerprint, arguments); hits are fresh copies"""
+
+    @functools.wraps(fn)
+    def wrapper(df: FrameLike, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        frame = _prepared(df)
+        if not cache_enabled():
+            return fn(frame, *args, **kwargs)
+        key = make_cache_key(fn.__name__, frame.fingerprint, args, sorted(kwargs.items()))
+        cached = _playbook_cache.get(key)
+        if cached is not None:
+            return cached
+        result = fn(frame, *args, **kwargs)
+        _playbook_cache.set(key, result)
+        return result
+
+    return wrapper
+
+
+@_cached_by_frame
+def overview_playbook(df: FrameLike) -> Dict[str, Any]:
     """
     Create a high-level overview of the dataset for non-technical users.
 
     Returns a simple table of numeric features with min/max/mean/std and missing%.
     """
+    frame = _prepared(df)
+    df = frame.df
     row_count = len(df)
     col_count = df.shape[1]
 
-    numeric_df = df.select_dtypes(include="number")
+    numeric_df = frame.numeric_df
     rows = []
 
     if not numeric_df.empty:
-        for col in numeric_df.columns:
-            series = pd.to_numeric(numeric_df[col], errors="coerce")
-            desc = series.describe()
-            missing_pct = (
-                100.0 * (1.0 - float(series.count()) / row_count) if row_count > 0 else 0.0
+        # Reduce one float64 block along axis 0 so each statistic is a single
+        # numpy call for all columns, rather than one pandas reduction per
+        # column per statistic. All-NaN and single-value columns yield NaN as
+        # pandas would. A non-empty numeric frame has rows, so row_count is
+        # never zero here.
+        values = numeric_df.to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            stats = np.vstack(
+                [
+                    np.nanmin(values, axis=0),
+                    np.nanmax(values, axis=0),
+                    np.nanmean(values, axis=0),
+                    np.nanstd(values, axis=0, ddof=1),
+                ]
             )
-
+        present = row_count - np.isnan(values).sum(axis=0)
+        summary = np.round(stats, 2).T.tolist()
+        missing = np.round(100.0 * (1.0 - present / row_count), 1).tolist()
+        for col, (col_min, col_max, col_mean, col_std), missing_pct in zip(
+            numeric_df.columns, summary, missing
+        ):
             rows.append(
                 {
                     "Feature": col,
-                    "Min": round(float(desc.get("min", 0.0)), 2) if "min" in desc else None,
-                    "Max": round(float(desc.get("max", 0.0)), 2) if "max" in desc else None,
-                    "Mean": round(float(desc.get("mean", 0.0)), 2) if "mean" in desc else None,
-                    "Std": round(float(desc.get("std", 0.0)), 2) if "std" in desc else None,
-                    "Missing %": round(missing_pct, 1),
+                    "Min": col_min,
+                    "Max": col_max,
+                    "Mean": col_mean,
+                    "Std": col_std,
+                    "Missing %": missing_pct,
                 }
             )
 
@@ -59,8 +155,67 @@ def overview_playbook(df: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
+def _encode_matrix(matrix: np.ndarray) -> Dict[str, Any]:
+    """
+    Pack a float matrix as base64 little-endian float32 with its shape.
+
+    A quarter of the size of nested JSON float lists and encoded in one C
+    call; clients decode with atob + Float32Array (or np.frombuffer).
+    """
+    return {
+        "dtype": "float32",
+        "shape": list(matrix.shape),
+        "data": base64.b64encode(matrix.astype("<f4").tobytes()).decode("ascii"),
+    }
+
+
+def _pairwise_corr(values: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation matrix of the columns of values, like DataFrame.corr().
+
+    Each pair uses every row where both columns are present, so sparse
+    columns do not discard rows for the whole matrix. pandas' corr() loops
+    over column pairs in Python; this is a handful of GEMMs instead.
+    Constant columns and pairs with fewer than two shared rows yield NaN.
+    """
+    X = values.astype(np.float64, copy=True)
+    missing = np.isnan(X)
+
+    if not missing.any():
+        # Single GEMM over a centered, unit-norm copy
+        X -= X.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            X /= np.linalg.norm(X, axis=0)
+        if X.size >= FLOAT32_GEMM_MIN_ELEMENTS:
+            # Columns are already unit-norm, so float32 loses nothing visible at
+            # 2-decimal output while halving the GEMM's memory traffic
+            X = X.astype(np.float32)
+        return np.clip((X.T @ X).astype(np.float64), -1.0, 1.0)
+
+    # Correlation is shift invariant; centering on the column mean first
+    # keeps the raw-moment sums below well conditioned
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        X -= np.nanmean(X, axis=0)
+    X[missing] = 0.0
+    present = (~missing).astype(np.float64)
+
+    # Sums over the rows where both column i and column j are present
+    n = present.T @ present
+    sum_x = X.T @ present
+    sum_xx = (X * X).T @ present
+    sum_xy = X.T @ X
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var = sum_xx - sum_x * sum_x / n
+        corr = cov / np.sqrt(var * var.T)
+    corr[n < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+@_cached_by_frame
 def correlation_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     outcome: str = "Outcome",
     top_n: int = 5,
 ) -> Dict[str, Any]:
@@ -68,10 +223,13 @@ def correlation_playbook(
     Analyze which numeric features are most related to the outcome.
 
     Returns a bar chart of top |correlation| with outcome, and embeds the full
-    correlation matrix in metadata for optional advanced views.
+    correlation matrix in metadata for optional advanced views (omitted for
+    frames wider than CORRELATION_MATRIX_MAX_COLUMNS).
     """
-    num_df = df.select_dtypes(include="number").dropna()
-    if outcome not in num_df.columns or num_df.shape[0] < 5:
+    frame = _prepared(df)
+    df = frame.df
+    num_df = frame.numeric_df
+    if outcome not in num_df.columns or num_df[outcome].count() < 5:
         return {
             "visualization": {
                 "type": "table",
@@ -89,7 +247,13 @@ def correlation_playbook(
             },
         }
 
-    corrs = num_df.corr()[outcome].drop(labels=[outcome]).dropna()
+    corr = _pairwise_corr(num_df.to_numpy(dtype=np.float64, na_value=np.nan))
+
+    corrs = (
+        pd.Series(corr[:, num_df.columns.get_loc(outcome)], index=num_df.columns)
+        .drop(labels=[outcome])
+        .dropna()
+    )
     if corrs.empty:
         return {
             "visualization": {
@@ -103,17 +267,23 @@ def correlation_playbook(
             },
         }
 
-    # Sort by absolute correlation strength
-    corrs = corrs.reindex(corrs.abs().sort_values(ascending=False).index)
-    top = corrs.head(top_n)
+    # Strongest absolute correlations: partial selection, then sort only the top
+    strength = np.abs(corrs.to_numpy())
+    k = max(1, min(top_n, strength.size))
+    top_idx = np.argpartition(-strength, k - 1)[:k]
+    top = corrs.iloc[top_idx[np.argsort(-strength[top_idx], kind="stable")]]
 
     labels = top.index.tolist()
-    values = [round(float(v), 2) for v in top.values]
-
-    # Full matrix for advanced/optional use
-    corr_matrix = num_df.corr().fillna(0.0)
-    matrix_labels = corr_matrix.columns.tolist()
-    matrix = corr_matrix.values.tolist()
+    values = np.round(top.to_numpy(), 2).tolist()
+
+    # Full matrix for advanced/optional use; very wide frames skip it, since
+    # its JSON grows with the square of the column count
+    metadata: Dict[str, Any] = {}
+    if corr.shape[0] <= CORRELATION_MATRIX_MAX_COLUMNS:
+        metadata["correlation_matrix"] = {
+            "labels": num_df.columns.tolist(),
+            **_encode_matrix(np.nan_to_num(corr, nan=0.0)),
+        }
 
     visualization = {
         "type": "bar",
@@ -129,12 +299,7 @@ def correlation_playbook(
             "xField": "Feature",
             "yField": "Correlation",
         },
-        "metadata": {
-            "correlation_matrix": {
-                "labels": matrix_labels,
-                "matrix": matrix,
-            }
-        },
+        "metadata": metadata,
     }
 
     analysis_context = {
@@ -150,14 +315,16 @@ def correlation_playbook(
 
 
 def distribution_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     feature: Optional[str] = None,
     bins: int = 10,
 ) -> Dict[str, Any]:
     """
     Explore the distribution of a single numeric feature with a histogram.
     """
-    numeric_df = df.select_dtypes(include="number")
+    frame = _prepared(df)
+    df = frame.df
+    numeric_df = frame.numeric_df
     if numeric_df.empty:
         return {
             "visualization": {
@@ -179,8 +346,11 @@ def distribution_playbook(
                 break
         feature = pick or numeric_df.columns[0]
 
-    series = pd.to_numeric(numeric_df[feature], errors="coerce").dropna()
-    if series.empty:
+    # Reduce over the raw ndarray rather than through pandas' Series methods;
+    # dropping NaN here also skips the Series copy dropna() would build
+    values_arr = numeric_df[feature].to_numpy(dtype=np.float64, na_value=np.nan)
+    values_arr = values_arr[~np.isnan(values_arr)]
+    if values_arr.size == 0:
         return {
             "visualization": {
                 "type": "table",
@@ -194,14 +364,15 @@ def distribution_playbook(
             },
         }
 
-    counts, bin_edges = np.histogram(series, bins=bins)
-    labels: List[str] = []
-    for i in range(len(bin_edges) - 1):
-        left = round(float(bin_edges[i]), 2)
-        right = round(float(bin_edges[i + 1]), 2)
-        labels.append(f"{left}–{right}")
+    # np.histogram would scan for min/max itself; passing the range reuses
+    # them (a constant series still gets the same +/-0.5 widened edges)
+    value_min = float(values_arr.min())
+    value_max = float(values_arr.max())
+    counts, bin_edges = np.histogram(values_arr, bins=bins, range=(value_min, value_max))
+    edges = np.round(bin_edges, 2).tolist()
+    labels = [f"{left}–{right}" for left, right in zip(edges, edges[1:])]
 
-    values = [int(c) for c in counts]
+    values = counts.tolist()
 
     visualization = {
         "type": "histogram",  # Use bar chart to represent histogram bins
@@ -223,11 +394,11 @@ def distribution_playbook(
     analysis_context = {
         "kind": "distribution",
         "feature": feature,
-        "row_count": int(series.shape[0]),
-        "min": round(float(series.min()), 2),
-        "max": round(float(series.max()), 2),
-        "mean": round(float(series.mean()), 2),
-        "median": round(float(series.median()), 2),
+        "row_count": int(values_arr.size),
+        "min": round(value_min, 2),
+        "max": round(value_max, 2),
+        "mean": round(float(values_arr.mean()), 2),
+        "median": round(float(np.median(values_arr)), 2),
     }
 
     return {
@@ -237,12 +408,13 @@ def distribution_playbook(
 
 
 def outcome_breakdown_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     outcome: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Show class balance / outcome distribution as a simple bar or pie chart.
     """
+    df = _prepared(df).df
     # Try to infer an outcome column if not provided
     if not outcome or outcome not in df.columns:
         candidate_names = {"outcome", "target", "label", "y"}
@@ -261,8 +433,17 @@ def outcome_breakdown_playbook(
             "analysis_context": {"kind": "outcome_breakdown", "reason": "no_outcome"},
         }
 
-    series = df[outcome].astype("category")
-    counts = series.value_counts().sort_index()
+    series = df[outcome]
+    if series.dtype == object:
+        # Categories order mixed-type labels safely, where a plain index sort
+        # would raise comparing str with int
+        series = series.astype("category")
+    # Numeric/bool outcomes count directly: building a categorical here
+    # would be thrown away after one value_counts
+    counts = series.value_counts(sort=False).sort_index()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Only observed categories belong in the breakdown
+        counts = counts[counts > 0]
     total = counts.sum()
 
     labels = [str(idx) for idx in counts.index.tolist()]
@@ -279,10 +460,8 @@ def outcome_breakdown_playbook(
         },
     }
 
-    percentages = {
-        str(idx): round(float(v) * 100.0 / float(total), 1) if total else 0.0
-        for idx, v in zip(counts.index.tolist(), counts.values.tolist())
-    }
+    shares = np.round(counts.to_numpy() * 100.0 / total, 1).tolist() if total else [0.0] * len(labels)
+    percentages = dict(zip(labels, shares))
 
     analysis_context = {
         "kind": "outcome_breakdown",
@@ -297,8 +476,25 @@ def outcome_breakdown_playbook(
     }
 
 
+def _infer_segment_column(df: pd.DataFrame, max_levels: int = 6) -> Optional[str]:
+    """
+    Return the first column with 2..max_levels distinct values, if any.
+
+    Numeric columns qualify too (e.g. a 0/1 Outcome), so rather than
+    excluding them, a short prefix is checked first: if it already holds more
+    than max_levels distinct values the full-column hash is skipped.
+    """
+    for col in df.columns:
+        series = df[col]
+        if series.iloc[:64].nunique(dropna=True) > max_levels:
+            continue
+        if 2 <= series.nunique(dropna=True) <= max_levels:
+            return col
+    return None
+
+
 def segment_comparison_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     segment_column: Optional[str] = None,
     outcome: Optional[str] = None,
 ) -> Dict[str, Any]:
@@ -308,13 +504,10 @@ def segment_comparison_playbook(
     - If outcome is provided and numeric/binary, compare mean outcome per segment.
     - Otherwise, compare row counts per segment.
     """
+    df = _prepared(df).df
     if segment_column is None or segment_column not in df.columns:
         # Fallback: pick first low-cardinality categorical-like column
-        for col in df.columns:
-            unique_vals = df[col].nunique(dropna=True)
-            if 2 <= unique_vals <= 6:
-                segment_column = col
-                break
+        segment_column = _infer_segment_column(df)
 
     if segment_column is None or segment_column not in df.columns:
         return {
@@ -329,8 +522,10 @@ def segment_comparison_playbook(
             },
         }
 
-    # Limit to top 2 most common segments for clarity
-    counts = df[segment_column].value_counts().head(2)
+    # Limit to top 2 most common segments for clarity; categorical columns
+    # report unused categories with a zero count, which are not cohorts
+    counts = df[segment_column].value_counts()
+    counts = counts[counts > 0].head(2)
     if counts.shape[0] < 2:
         return {
             "visualization": {
@@ -353,14 +548,13 @@ def segment_comparison_playbook(
 
     if outcome and outcome in df.columns and pd.api.types.is_numeric_dtype(df[outcome]):
         metric_name = f"Average {outcome}"
-        means = []
-        for seg in segments:
-            seg_df = df[df[segment_column] == seg]
-            if seg_df.empty:
-                means.append(0.0)
-            else:
-                means.append(round(float(seg_df[outcome].mean()), 3))
-        segment_values = means
+        # One grouped aggregation instead of a boolean mask + filtered copy per segment
+        means = (
+            df.groupby(segment_column, observed=True, sort=False)[outcome]
+            .mean()
+            .reindex(segments)
+        )
+        segment_values = np.round(means.to_numpy(dtype=np.float64), 3).tolist()
     else:
         segment_values = [int(v) for v in counts.values.tolist()]
 
@@ -407,8 +601,27 @@ def segment_comparison_playbook(
     }
 
 
+def _qcut_label_edges(edges: np.ndarray) -> List[float]:
+    """
+    Round bin edges the way pd.qcut's interval labels do, then to 2 decimals.
+
+    qcut keeps 3 decimals past the first significant digit and nudges the
+    lowest edge down by 0.001; mirroring that keeps range labels unchanged.
+    """
+    rounded: List[float] = []
+    for x in edges.tolist():
+        if x == 0:
+            rounded.append(0.0)
+            continue
+        whole = int(x)
+        digits = 3 if whole else -int(np.floor(np.log10(abs(x)))) - 1 + 3
+        rounded.append(float(np.around(x, digits)))
+    rounded[0] -= 0.001
+    return [round(x, 2) for x in rounded]
+
+
 def feature_outcome_profile_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     feature: Optional[str] = None,
     outcome: Optional[str] = None,
     bins: int = 8,
@@ -420,7 +633,9 @@ def feature_outcome_profile_playbook(
     - Compute average outcome in each bin.
     - Return a line chart of outcome rate by feature bin.
     """
-    num_df = df.select_dtypes(include="number")
+    frame = _prepared(df)
+    df = frame.df
+    num_df = frame.numeric_df
     if num_df.empty:
         return {
             "visualization": {
@@ -463,13 +678,15 @@ def feature_outcome_profile_playbook(
             },
         }
 
-    feature_series = pd.to_numeric(df[feature], errors="coerce")
-    outcome_series = pd.to_numeric(df[outcome], errors="coerce")
-    mask = feature_series.notna() & outcome_series.notna()
-    feature_series = feature_series[mask]
-    outcome_series = outcome_series[mask]
+    # Both columns are numeric by now, so filter missing pairs on the raw
+    # float arrays rather than through Series masks and reindexing
+    f = df[feature].to_numpy(dtype=np.float64, na_value=np.nan)
+    o = df[outcome].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~(np.isnan(f) | np.isnan(o))
+    f = f[valid]
+    o = o[valid]
 
-    if feature_series.empty or outcome_series.empty:
+    if f.size == 0:
         return {
             "visualization": {
                 "type": "table",
@@ -484,9 +701,10 @@ def feature_outcome_profile_playbook(
             },
         }
 
-    try:
-        quantiles = pd.qcut(feature_series, q=bins, duplicates="drop")
-    except ValueError:
+    # Same edges as pd.qcut(duplicates="drop"), without building Interval
+    # objects or hashing them in a groupby
+    edges = np.unique(np.quantile(f, np.linspace(0, 1, bins + 1)))
+    if len(edges) < 2:
         # Not enough unique values for quantile bins
         return {
             "visualization": {
@@ -502,16 +720,18 @@ def feature_outcome_profile_playbook(
             },
         }
 
-    grouped = outcome_series.groupby(quantiles).mean()
-    labels: List[str] = []
-    values: List[float] = []
-    for interval, mean_val in grouped.items():
-        if pd.isna(mean_val):
-            continue
-        left = round(float(interval.left), 2)
-        right = round(float(interval.right), 2)
-        labels.append(f"{left}–{right}")
-        values.append(round(float(mean_val), 3))
+    # Right-closed bins with the lowest value in the first bin, as qcut does
+    n_bins = len(edges) - 1
+    bin_ids = np.searchsorted(edges[1:-1], f, side="left")
+    counts = np.bincount(bin_ids, minlength=n_bins)
+    sums = np.bincount(bin_ids, weights=o, minlength=n_bins)
+    filled = counts > 0
+    means = sums[filled] / counts[filled]
+    label_edges = _qcut_label_edges(edges)
+    labels: List[str] = [
+        f"{label_edges[i]}–{label_edges[i + 1]}" for i in np.flatnonzero(filled).tolist()
+    ]
+    values: List[float] = np.round(means, 3).tolist()
 
     visualization = {
         "type": "line",
@@ -561,14 +781,16 @@ def feature_outcome_profile_playbook(
 
 
 def relationship_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     feature_x: Optional[str] = None,
     feature_y: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Show the relationship between two numeric features using a scatter plot.
     """
-    num_df = df.select_dtypes(include="number")
+    frame = _prepared(df)
+    df = frame.df
+    num_df = frame.numeric_df
     if num_df.shape[1] < 2:
         return {
             "visualization": {
@@ -586,13 +808,15 @@ def relationship_playbook(
     if not feature_y or feature_y not in candidates or feature_y == feature_x:
         feature_y = candidates[1] if len(candidates) > 1 else candidates[0]
 
-    x_series = pd.to_numeric(df[feature_x], errors="coerce")
-    y_series = pd.to_numeric(df[feature_y], errors="coerce")
-    mask = x_series.notna() & y_series.notna()
-    x_values = x_series[mask].tolist()
-    y_values = y_series[mask].tolist()
+    # Native dtypes keep integer columns as ints in the chart payload;
+    # pd.isna on the ndarrays avoids building intermediate boolean Series
+    xa = num_df[feature_x].to_numpy()
+    ya = num_df[feature_y].to_numpy()
+    valid = ~(pd.isna(xa) | pd.isna(ya))
+    xa = xa[valid]
+    ya = ya[valid]
 
-    if len(x_values) < 5:
+    if len(xa) < 5:
         return {
             "visualization": {
                 "type": "table",
@@ -608,16 +832,19 @@ def relationship_playbook(
         }
 
     # Simple Pearson correlation as a numeric summary
-    try:
-        corr = float(pd.Series(x_values).corr(pd.Series(y_values)))
-    except Exception:
-        corr = None
-
+    # NaN for a constant feature, matching Series.corr
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = float(np.corrcoef(xa, ya)[0, 1])
+
+    # The full set feeds the correlation; the chart only needs an even sample
+    step = -(-len(xa) // SCATTER_MAX_POINTS)
+    plot_x = xa[::step].tolist()
+    plot_y = ya[::step].tolist()
     visualization = {
         "type": "scatter",
         "data": {
-            "x": x_values,
-            "y": y_values,
+            "x": plot_x,
+            "y": plot_y,
         },
         "config": {
             "title": f"{feature_y} vs {feature_x}",
@@ -633,9 +860,11 @@ def relationship_playbook(
         "kind": "relationship",
         "feature_x": feature_x,
         "feature_y": feature_y,
-        "correlation": round(corr, 3) if corr is not None else None,
-        "point_count": len(x_values),
+        "correlation": round(corr, 3),
+        "point_count": len(xa),
     }
+    if step > 1:
+        analysis_context["plotted_points"] = len(plot_x)
 
     return {
         "visualization": visualization,
@@ -644,7 +873,7 @@ def relationship_playbook(
 
 
 def segmented_distribution_playbook(
-    df: pd.DataFrame,
+    df: FrameLike,
     feature: Optional[str] = None,
     segment_column: Optional[str] = None,
 ) -> Dict[str, Any]:
@@ -654,6 +883,8 @@ def segmented_distribution_playbook(
     For now this returns a bar chart of the mean feature value per segment, and
     includes basic distribution summaries in the analysis context.
     """
+    frame = _prepared(df)
+    df = frame.df
     if df.empty:
         return {
             "visualization": {
@@ -664,7 +895,7 @@ def segmented_distribution_playbook(
             "analysis_context": {"kind": "segmented_distribution", "reason": "empty_dataframe"},
         }
 
-    num_df = df.select_dtypes(include="number")
+    num_df = frame.numeric_df
     if num_df.empty:
         return {
             "visualization": {
@@ -687,11 +918,7 @@ def segmented_distribution_playbook(
 
     # Infer segment column if needed
     if segment_column is None or segment_column not in df.columns:
-        for col in df.columns:
-            unique_vals = df[col].nunique(dropna=True)
-            if 2 <= unique_vals <= 6:
-                segment_column = col
-                break
+        segment_column = _infer_segment_column(df)
 
     if segment_column is None or segment_column not in df.columns:
         return {
@@ -707,9 +934,13 @@ def segmented_distribution_playbook(
             },
         }
 
-    grouped = df.groupby(segment_column)[feature]
-    means = grouped.mean().dropna()
-    if means.empty:
+    # Every per-segment statistic in one grouped aggregation; segments with
+    # no valid feature values are dropped
+    stats = df.groupby(segment_column, observed=True)[feature].agg(
+        ["count", "mean", "median", "min", "max"]
+    )
+    stats = stats[stats["count"] > 0]
+    if stats.empty:
         return {
             "visualization": {
                 "type": "table",
@@ -724,8 +955,9 @@ def segmented_distribution_playbook(
             },
         }
 
-    labels = [str(idx) for idx in means.index.tolist()]
-    values = [round(float(v), 2) for v in means.values.tolist()]
+    labels = [str(idx) for idx in stats.index.tolist()]
+    rounded = np.round(stats[["mean", "median", "min", "max"]].to_numpy(dtype=np.float64), 2).tolist()
+    values = [row[0] for row in rounded]
 
     visualization = {
         "type": "bar",
@@ -744,21 +976,19 @@ def segmented_distribution_playbook(
     }
 
     # Basic per-segment summary stats
-    summaries: List[Dict[str, Any]] = []
-    for seg, series in grouped:
-        s = pd.to_numeric(series, errors="coerce").dropna()
-        if s.empty:
-            continue
-        summaries.append(
-            {
-                "segment": str(seg),
-                "count": int(s.shape[0]),
-                "mean": round(float(s.mean()), 2),
-                "median": round(float(s.median()), 2),
-                "min": round(float(s.min()), 2),
-                "max": round(float(s.max()), 2),
-            }
+    summaries: List[Dict[str, Any]] = [
+        {
+            "segment": label,
+            "count": count,
+            "mean": mean,
+            "median": median,
+            "min": low,
+            "max": high,
+        }
+        for label, count, (mean, median, low, high) in zip(
+            labels, stats["count"].tolist(), rounded
         )
+    ]
 
     analysis_context = {
         "kind": "segmented_distribution",
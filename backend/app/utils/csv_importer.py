@@ -1,9 +1,10 @@
 """CSV import utility for creating tables and inserting data"""
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from sqlalchemy import text
 from pathlib import Path
 import io
+import mmap
 import asyncio
 
 
@@ -69,7 +70,7 @@ class CSVImporter:
     @staticmethod
     async def import_csv(
         engine,
-        csv_content: bytes,
+        csv_content: Union[bytes, memoryview, mmap.mmap],
         table_name: Optional[str] = None,
         encoding: str = 'utf-8',
         delimiter: str = ','
@@ -79,7 +80,8 @@ class CSVImporter:
         
         Args:
             engine: SQLAlchemy async engine
-            csv_content: CSV file content as bytes
+            csv_content: CSV file content as bytes, or a read-only mmap of
+                the file (parsed in place without loading it into memory)
             table_name: Optional table name (defaults to filename)
             encoding: File encoding
             delimiter: CSV delimiter
@@ -92,8 +94,13 @@ class CSVImporter:
             loop = asyncio.get_event_loop()
             
             def read_csv():
-                csv_string = csv_content.decode(encoding)
-                return pd.read_csv(io.StringIO(csv_string), delimiter=delimiter)
+                # Parse the raw bytes directly rather than decoding a full
+                # copy into a str first; mmaps are already file-like.
+                if isinstance(csv_content, mmap.mmap):
+                    source = csv_content
+                else:
+                    source = io.BytesIO(csv_content)
+                return pd.read_csv(source, delimiter=delimiter, encoding=encoding)
             
             # Read CSV into pandas DataFrame (non-blocking)
             df = await loop.run_in_executor(None, read_csv)
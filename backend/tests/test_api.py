@@ -1,4 +1,6 @@
 """Integration tests for API endpoints"""
+import asyncio
+import sqlite3
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -68,6 +70,39 @@ class TestHealthEndpoints:
         assert "status" in data
         assert data["status"] == "healthy"
 
+    def test_routes_registered_once(self):
+        """Test that no path/method pair is registered twice"""
+        pairs = [
+            (route.path, method)
+            for route in app.routes
+            for method in getattr(route, "methods", None) or ()
+        ]
+        assert len(pairs) == len(set(pairs))
+
+
+class TestErrorCorsHeaders:
+    """Tests for CORS headers on error responses"""
+
+    def test_allowed_origin_is_echoed(self, client):
+        """Test that an allowed origin is reflected on error responses"""
+        from app.config import settings
+
+        origin = settings.cors_origins[-1]
+        response = client.get("/api/v1/datasets/u/missing/schema", headers={"Origin": origin})
+
+        assert response.status_code >= 400
+        assert response.headers["access-control-allow-origin"] == origin
+
+    def test_unknown_origin_falls_back(self, client):
+        """Test that unknown origins get the first allowed origin"""
+        from app.config import settings
+
+        response = client.get(
+            "/api/v1/datasets/u/missing/schema", headers={"Origin": "https://evil.example"}
+        )
+
+        assert response.headers["access-control-allow-origin"] == settings.cors_origins[0]
+
 
 class TestAuthEndpoints:
     """Tests for authentication endpoints"""
@@ -146,3 +181,212 @@ class TestAuthEndpoints:
         assert response.status_code == 401
 
 
+
+
+@pytest.fixture
+def query_dataset(monkeypatch, temp_data_dir, sample_dataframe):
+    """Create a temporary dataset and stub out the LLM-backed services"""
+    from app.dependencies import get_analysis_service, get_query_service
+    from app.core.database import db_manager
+
+    monkeypatch.setattr(db_manager, "data_path", temp_data_dir)
+    db_path = db_manager.get_database_path("user1", "ds")
+    conn = sqlite3.connect(db_path)
+    sample_dataframe.to_sql("patients", conn, index=False)
+    conn.close()
+
+    plan = {
+        "intent": "drivers",
+        "playbook": "correlation",
+        "target": "outcome",
+        "secondary_playbooks": [],
+    }
+
+    async def fake_select_analysis(user_query, schema_info, **kwargs):
+        return dict(plan)
+
+    async def fake_generate_insights(user_query, results, sql, structure, visualization, extras=None, **kwargs):
+        return {"summary": "ok", "key_findings": [], "patterns": [], "recommendations": [], "follow_ups": []}
+
+    monkeypatch.setattr(get_query_service(), "select_analysis", fake_select_analysis)
+    monkeypatch.setattr(get_analysis_service(), "generate_insights", fake_generate_insights)
+
+    yield plan
+
+    asyncio.run(db_manager.dispose_engine("user1", "ds"))
+    db_manager.invalidate_schema("user1", "ds")
+
+
+class TestQueryEndpoint:
+    """Tests for the /query endpoint"""
+
+    def test_query_drivers(self, client, query_dataset):
+        """Test a drivers question runs correlation plus the default profile"""
+        response = client.post(
+            "/api/v1/query",
+            json={"user_id": "user1", "dataset_id": "ds", "query": "What drives outcome?"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["visualization"]["type"] == "bar"
+        assert data["data_structure"]["kind"] == "correlation"
+        assert len(data["results"]) == 100
+        assert [v["type"] for v in data["extra_visualizations"]] == ["line"]
+        assert data["analysis"]["summary"] == "ok"
+
+    def test_export_table_rows(self, client, query_dataset):
+        """Test streaming a table as NDJSON"""
+        import json
+
+        response = client.get("/api/v1/datasets/user1/ds/tables/patients/rows")
+
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 100
+        assert "outcome" in rows[0]
+
+    def test_export_unknown_table(self, client, query_dataset):
+        """Test that only tables in the schema can be exported"""
+        response = client.get("/api/v1/datasets/user1/ds/tables/missing/rows")
+
+        assert response.status_code == 404
+
+    def test_query_with_filter(self, client, query_dataset):
+        """Test that planner filters restrict the analyzed rows"""
+        query_dataset.update(
+            {
+                "intent": "overview",
+                "playbook": "overview",
+                "target": None,
+                "filter_segment": {"column": "outcome", "value": 1},
+            }
+        )
+        response = client.post(
+            "/api/v1/query",
+            json={"user_id": "user1", "dataset_id": "ds", "query": "Describe positive cases"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["visualization"]["type"] == "table"
+        assert data["data_structure"]["row_count"] < 100
+
+    def test_query_skips_duplicate_secondaries(self, client, query_dataset):
+        """Test that secondaries repeating the primary or each other run once"""
+        query_dataset.update(
+            {
+                "intent": "distribution",
+                "playbook": "distribution",
+                "secondary_playbooks": ["distribution", "correlation", "correlation"],
+            }
+        )
+        response = client.post(
+            "/api/v1/query",
+            json={"user_id": "user1", "dataset_id": "ds", "query": "Show the age distribution"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["visualization"]["type"] == "histogram"
+        assert [v["type"] for v in data["extra_visualizations"]] == ["bar"]
+
+    def test_query_unknown_dataset(self, client, query_dataset):
+        """Test querying a dataset that does not exist"""
+        response = client.post(
+            "/api/v1/query",
+            json={"user_id": "user1", "dataset_id": "missing", "query": "overview"},
+        )
+        assert response.status_code == 404
+
+
+class TestBuildFetchQuery:
+    """Tests for the data-fetch SQL builder"""
+
+    table = {"name": "patients", "columns": [{"name": "age"}, {"name": "outcome"}]}
+
+    def test_no_filters(self):
+        """Test the unfiltered fetch, limited for overviews"""
+        from app.api.routes.query import _build_fetch_query
+
+        assert _build_fetch_query(self.table, "correlation", {}) == ('SELECT * FROM "patients"', {})
+        sql, _ = _build_fetch_query(self.table, "overview", {})
+        assert sql == 'SELECT * FROM "patients" LIMIT 500'
+
+    def test_filters_are_parameterized(self):
+        """Test that planner filters become bound WHERE conditions"""
+        from app.api.routes.query import _build_fetch_query
+
+        sql, params = _build_fetch_query(
+            self.table,
+            "distribution",
+            {
+                "filter_segment": {"column": "outcome", "value": 1},
+                "focus_range": {"feature": "age", "min": 30, "max": 60},
+            },
+        )
+        assert sql == (
+            'SELECT * FROM "patients" WHERE "outcome" = :segment_value '
+            'AND "age" BETWEEN :range_min AND :range_max'
+        )
+        assert params == {"segment_value": 1, "range_min": 30, "range_max": 60}
+
+    def test_unknown_columns_are_ignored(self):
+        """Test that columns not in the schema never reach the SQL"""
+        from app.api.routes.query import _build_fetch_query
+
+        sql, params = _build_fetch_query(
+            self.table,
+            "distribution",
+            {"filter_segment": {"column": "age; DROP TABLE patients", "value": 1}},
+        )
+        assert sql == 'SELECT * FROM "patients"'
+        assert params == {}
+
+
+class TestBuildDataFrame:
+    """Tests for the column-wise DataFrame builder"""
+
+    table = {
+        "name": "t",
+        "columns": [
+            {"name": "age", "type": "INTEGER"},
+            {"name": "bmi", "type": "REAL"},
+            {"name": "visits", "type": "INTEGER"},
+            {"name": "mixed", "type": "INTEGER"},
+            {"name": "label", "type": "TEXT"},
+        ],
+    }
+
+    def test_matches_pandas_inference(self):
+        """Test that dtypes and values match pd.DataFrame(results)"""
+        import pandas as pd
+        from app.api.routes.query import _build_dataframe
+
+        results = [
+            {"age": 30, "bmi": 22.5, "visits": 1, "mixed": 1, "label": "a"},
+            {"age": 41, "bmi": None, "visits": None, "mixed": "n/a", "label": None},
+            {"age": 52, "bmi": 30.0, "visits": 3, "mixed": 2, "label": "b"},
+        ]
+
+        columns = {name: [row[name] for row in results] for name in results[0]}
+
+        pd.testing.assert_frame_equal(_build_dataframe(columns, self.table), pd.DataFrame(results))
+
+    def test_empty_results(self):
+        """Test building from an empty result set"""
+        from app.api.routes.query import _build_dataframe
+
+        assert _build_dataframe({}, self.table).empty
+        assert _build_dataframe({"age": []}, self.table).empty
+
+    def test_structure_analysis_reuses_dataframe(self):
+        """Test that analyzing a pre-built DataFrame matches analyzing raw rows"""
+        from app.api.routes.query import _build_dataframe
+        from app.services.data_analysis_service import DataAnalysisService
+
+        results = [
+            {"age": 30, "bmi": 22.5, "visits": 1, "mixed": 1, "label": "a"},
+            {"age": 52, "bmi": 30.0, "visits": 3, "mixed": 2, "label": "b"},
+        ]
+        service = DataAnalysisService()
+        df = _build_dataframe({name: [row[name] for row in results] for name in results[0]}, self.table)
+
+        assert service.analyze_structure(results, df) == service.analyze_structure(results)
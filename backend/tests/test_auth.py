@@ -62,6 +62,18 @@ class TestPasswordHashing:
         
         assert hash1 == hash2
 
+    def test_hash_password_uses_argon2(self):
+        """Test that new hashes are Argon2id encoded strings"""
+        assert auth._hash_password("test_password").startswith("$argon2id$")
+
+    def test_verify_legacy_password(self):
+        """Test that legacy salt$sha256 hashes still verify"""
+        legacy = auth._legacy_hash_password("test_password", "abc123")
+
+        assert auth._verify_password("test_password", legacy) is True
+        assert auth._verify_password("wrong_password", legacy) is False
+        assert auth._verify_password("test_password", "abc123$not-hex") is False
+
 
 class TestUserManagement:
     """Tests for user creation and retrieval"""
@@ -106,6 +118,7 @@ class TestUserManagement:
         assert retrieved["email"] == "test@example.com"
         assert retrieved["full_name"] == "Test User"
         assert "password_hash" in retrieved
+        assert retrieved["created_at"].endswith("+00:00")
 
     def test_get_user_by_email_not_found(self, temp_auth_db):
         """Test retrieving non-existent user"""
@@ -126,6 +139,31 @@ class TestUserManagement:
         assert user["email"] == "test@example.com"
         assert "password_hash" not in user  # Should be removed
 
+    def test_authenticate_user_upgrades_legacy_hash(self, temp_auth_db):
+        """Test that a legacy hash is replaced with Argon2 on login"""
+        user = auth.create_user(email="test@example.com", password="password123")
+        auth._update_password_hash(
+            user["user_id"], auth._legacy_hash_password("password123", "abc123")
+        )
+
+        assert auth.authenticate_user("test@example.com", "password123") is not None
+        stored = auth.get_user_by_email("test@example.com")["password_hash"]
+        assert stored.startswith("$argon2id$")
+        assert auth.authenticate_user("test@example.com", "password123") is not None
+
+    def test_connection_cached_per_thread(self, temp_auth_db):
+        """Test that repeated calls on one thread reuse a single connection"""
+        import threading
+
+        conn = auth._get_connection()
+        assert auth._get_connection() is conn
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(auth._get_connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn
+
     def test_authenticate_user_wrong_password(self, temp_auth_db):
         """Test authentication with wrong password"""
         auth.create_user(
@@ -173,6 +211,36 @@ class TestJWT:
         
         assert decoded["sub"] == "user123"
         assert decoded["email"] == "test@example.com"
-        assert "exp" in decoded
+        assert isinstance(decoded["exp"], int)
 
+    def test_eddsa_round_trip(self, monkeypatch):
+        """Test signing and verifying with an Ed25519 keypair"""
+        ed25519 = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.ed25519")
+        from cryptography.hazmat.primitives import serialization
+
+        private_pem = ed25519.Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode("utf-8")
+        monkeypatch.setattr(auth.settings, "jwt_algorithm", "EdDSA")
+        monkeypatch.setattr(auth.settings, "jwt_private_key", private_pem)
+        monkeypatch.setattr(auth.settings, "jwt_public_key", "")
+
+        token = auth.create_access_token({"sub": "user123"})
+
+        assert auth.decode_access_token(token)["sub"] == "user123"
+
+    def test_token_interoperates_with_pyjwt(self, monkeypatch):
+        """Test that tokens match what stock PyJWT produces and accepts"""
+        import jwt
+
+        monkeypatch.setattr(auth.settings, "jwt_secret", "test_secret_key")
+        monkeypatch.setattr(auth.settings, "jwt_algorithm", "HS256")
+
+        token = auth.create_access_token({"sub": "user123"})
+        decoded = jwt.decode(token, "test_secret_key", algorithms=["HS256"])
+        assert decoded["sub"] == "user123"
 
+        foreign = jwt.encode({"sub": "user456"}, "test_secret_key", algorithm="HS256")
+        assert auth.decode_access_token(foreign)["sub"] == "user456"
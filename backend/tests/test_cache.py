@@ -0,0 +1,229 @@
+"""Tests for the LLM response cache"""
+import math
+import pytest
+from app.core import cache
+from app.core.cache import ObjectCache, ResponseCache, make_cache_key, normalize_query
+
+
+class TestResponseCache:
+    """Tests for ResponseCache"""
+
+    def test_set_and_get(self):
+        """Test storing and retrieving a value"""
+        rc = ResponseCache()
+        rc.set("k", {"playbook": "overview"})
+
+        assert rc.get("k") == {"playbook": "overview"}
+        assert rc.get("missing") is None
+
+    def test_get_returns_copy(self):
+        """Test that mutating a hit does not affect the cached value"""
+        rc = ResponseCache()
+        rc.set("k", {"items": [1, 2]})
+
+        hit = rc.get("k")
+        hit["items"].append(3)
+
+        assert rc.get("k") == {"items": [1, 2]}
+
+    def test_expired_entry_is_dropped(self):
+        """Test that entries past their TTL are treated as misses"""
+        rc = ResponseCache(ttl_seconds=-1)
+        rc.set("k", 1)
+
+        assert rc.get("k") is None
+        assert len(rc) == 0
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when full"""
+        rc = ResponseCache(max_entries=2)
+        rc.set("a", 1)
+        rc.set("b", 2)
+        rc.get("a")
+        rc.set("c", 3)
+
+        assert rc.get("a") == 1
+        assert rc.get("b") is None
+        assert rc.get("c") == 3
+
+    def test_invalidate_by_tag(self):
+        """Test dropping every entry for a dataset"""
+        rc = ResponseCache()
+        rc.set("a", 1, tag=("u1", "ds"))
+        rc.set("b", 2, tag=("u1", "ds"))
+        rc.set("c", 3, tag=("u2", "ds"))
+
+        assert rc.invalidate(("u1", "ds")) == 2
+        assert rc.get("a") is None
+        assert rc.get("b") is None
+        assert rc.get("c") == 3
+
+
+class TestObjectCache:
+    """Tests for ObjectCache"""
+
+    def test_values_round_trip_unchanged(self):
+        """Test that NaN, tuples and integer keys survive a hit"""
+        oc = ObjectCache()
+        oc.set("k", {"std": float("nan"), "pair": (1, 2), "labels": {0: "a"}})
+
+        hit = oc.get("k")
+
+        assert math.isnan(hit["std"])
+        assert hit["pair"] == (1, 2)
+        assert hit["labels"] == {0: "a"}
+
+    def test_get_returns_copy(self):
+        """Test that mutating a hit does not affect the cached value"""
+        oc = ObjectCache()
+        oc.set("k", {"items": [1, 2]})
+
+        oc.get("k")["items"].append(3)
+
+        assert oc.get("k") == {"items": [1, 2]}
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when full"""
+        oc = ObjectCache(max_entries=2)
+        oc.set("a", 1)
+        oc.set("b", 2)
+        oc.get("a")
+        oc.set("c", 3)
+
+        assert oc.get("b") is None
+        assert oc.get("a") == 1
+
+
+class TestCachePersistence:
+    """Tests for saving and restoring ResponseCache snapshots"""
+
+    def test_round_trip_keeps_values_and_tags(self, tmp_path):
+        """Test that a restored cache serves hits and still invalidates by tag"""
+        path = tmp_path / "cache.json"
+        rc = ResponseCache()
+        rc.set("a", {"playbook": "overview"}, tag=("u1", "ds"))
+        rc.set("b", [1, 2])
+
+        assert rc.save(path) == 2
+
+        restored = ResponseCache()
+        assert restored.load(path) == 2
+        assert restored.get("a") == {"playbook": "overview"}
+        assert restored.get("b") == [1, 2]
+        assert restored.invalidate(("u1", "ds")) == 1
+
+    def test_expired_entries_are_not_restored(self, tmp_path):
+        """Test that entries past their TTL are neither saved nor loaded"""
+        path = tmp_path / "cache.json"
+        rc = ResponseCache(ttl_seconds=-1)
+        rc.set("k", 1)
+
+        assert rc.save(path) == 0
+        assert ResponseCache().load(path) == 0
+
+    def test_missing_file_is_ignored(self, tmp_path):
+        """Test that loading without a snapshot is a no-op"""
+        rc = ResponseCache()
+
+        assert rc.load(tmp_path / "missing.json") == 0
+        assert len(rc) == 0
+
+
+class TestCacheKeys:
+    """Tests for cache key helpers"""
+
+    def test_normalize_query(self):
+        """Test whitespace and case normalization"""
+        assert normalize_query("  Show   the OVERVIEW ") == "show the overview"
+
+    def test_make_cache_key_is_stable(self):
+        """Test that identical parts produce identical keys"""
+        assert make_cache_key("plan", "u1", None) == make_cache_key("plan", "u1", None)
+        assert make_cache_key("plan", "u1") != make_cache_key("plan", "u2")
+
+
+class TestCacheEnabled:
+    """Tests for cache_enabled"""
+
+    def test_disabled_in_debug(self, monkeypatch):
+        """Test that the cache is bypassed in debug mode"""
+        monkeypatch.setattr(cache.settings, "debug", True)
+        assert cache.cache_enabled() is False
+
+    def test_disabled_per_request(self, monkeypatch):
+        """Test that callers can opt out per request"""
+        monkeypatch.setattr(cache.settings, "debug", False)
+        assert cache.cache_enabled(use_cache=False) is False
+        assert cache.cache_enabled() is True
+
+
+class TestInsightsCache:
+    """Tests for caching generated narratives"""
+
+    @pytest.fixture
+    def service(self, monkeypatch):
+        """AnalysisService with a counting fake LLM and an empty cache"""
+        from app.services import analysis_service
+
+        class FakeLLM:
+            calls = 0
+
+            async def generate_json(self, messages, **kwargs):
+                FakeLLM.calls += 1
+                return {"summary": "ok", "follow_ups": ["Show more"]}
+
+        monkeypatch.setattr(cache.settings, "debug", False)
+        monkeypatch.setattr(analysis_service, "response_cache", ResponseCache())
+        return analysis_service.AnalysisService(llm=FakeLLM())
+
+    async def test_rephrased_question_hits_cache(self, service):
+        """Test that case/spacing changes and different SQL reuse the narrative"""
+        results = [{"age": 30}]
+        structure = {"columns": {"age": {}}}
+        first = await service.generate_insights("Show ages", results, "SELECT age FROM t", structure, {})
+        second = await service.generate_insights("  show   AGES ", results, "SELECT t.age FROM t", structure, {})
+
+        assert second == first
+        assert service.llm.calls == 1
+
+    async def test_different_data_misses_cache(self, service):
+        """Test that a different results summary calls the LLM again"""
+        structure = {"columns": {"age": {}}}
+        await service.generate_insights("Show ages", [{"age": 30}], "SELECT age FROM t", structure, {})
+        await service.generate_insights("Show ages", [{"age": 31}], "SELECT age FROM t", structure, {})
+
+        assert service.llm.calls == 2
+
+    async def test_batch_preserves_order(self, service):
+        """Test that batched insights come back in input order with fallbacks"""
+        structure = {"columns": {"age": {}}}
+        inputs = [
+            dict(user_query="Show ages", query_results=[{"age": 30}], sql="", data_structure=structure, visualization={}),
+            dict(user_query="Broken", query_results=[{"age": 31}], sql="", data_structure=structure, visualization=None),
+        ]
+
+        first, second = await service.generate_insights_batch(inputs)
+
+        assert first["summary"] == "ok"
+        assert second["summary"] == "Query returned 1 result."
+
+    def test_duplicate_extra_visualizations_are_skipped(self, service):
+        """Test that repeated chart descriptions do not bloat the prompt"""
+        primary = {"type": "bar", "config": {"title": "Age by group"}}
+        extras = [
+            {"type": "bar", "config": {"title": "age  by GROUP"}},
+            {"type": "histogram", "config": {"title": "Age"}},
+            {"type": "histogram", "config": {"title": "Age"}},
+        ]
+
+        summary = service._prepare_results_summary([{"age": 30}], {}, primary, extras)
+
+        assert "Additional visualizations (1):" in summary
+        assert summary.count("- histogram: Age") == 1
+
+    async def test_empty_results_skip_llm(self, service):
+        """Test that empty results return the fallback without an LLM call"""
+        insights = await service.generate_insights("Show ages", [], "SELECT age FROM t", {}, {})
+
+        assert insights["summary"] == "Query returned 0 results."
+        assert service.llm.calls == 0
@@ -0,0 +1,42 @@
+"""Tests for CSV import"""
+import mmap
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.utils.csv_importer import CSVImporter
+
+
+CSV = b"Age,BMI,Outcome\n30,22.5,0\n41,,1\n"
+
+
+async def _import(tmp_path, content):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    try:
+        result = await CSVImporter.import_csv(engine, content, table_name="people")
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text("SELECT * FROM people"))).fetchall()
+    finally:
+        await engine.dispose()
+    return result, rows
+
+
+class TestImportCSV:
+    """Tests for CSVImporter.import_csv"""
+
+    async def test_import_bytes(self, tmp_path):
+        """Test importing CSV content held in memory"""
+        result, rows = await _import(tmp_path, CSV)
+
+        assert result["rows_imported"] == 2
+        assert result["columns"] == ["Age", "BMI", "Outcome"]
+        assert rows == [(30, 22.5, 0), (41, None, 1)]
+
+    async def test_import_mmap(self, tmp_path):
+        """Test importing from a memory-mapped file"""
+        csv_path = tmp_path / "data.csv"
+        csv_path.write_bytes(CSV)
+
+        with open(csv_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result, rows = await _import(tmp_path, mm)
+
+        assert result["rows_imported"] == 2
+        assert rows == [(30, 22.5, 0), (41, None, 1)]
@@ -0,0 +1,320 @@
+"""Tests for the database manager"""
+import sqlite3
+import pytest
+from sqlalchemy import text
+from app.core.database import DatabaseManager, _first_statement
+
+
+@pytest.fixture
+async def manager(temp_data_dir):
+    """Create a DatabaseManager rooted in a temporary directory with one dataset"""
+    mgr = DatabaseManager()
+    mgr.data_path = temp_data_dir
+
+    db_path = mgr.get_database_path("user1", "ds")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE people (age INTEGER, name TEXT)")
+    conn.execute("INSERT INTO people VALUES (30, 'a'), (40, 'b')")
+    conn.commit()
+    conn.close()
+
+    yield mgr
+    await mgr.close_all()
+
+
+class TestSchemaCache:
+    """Tests for get_schema caching"""
+
+    async def test_get_schema(self, manager):
+        """Test reading schema information"""
+        schema = await manager.get_schema("user1", "ds")
+
+        assert [t["name"] for t in schema["tables"]] == ["people"]
+        assert [c["name"] for c in schema["tables"][0]["columns"]] == ["age", "name"]
+        assert len(schema["tables"][0]["sample_rows"]) == 2
+
+    async def test_get_schema_quoted_table(self, manager):
+        """Test columns and samples for a table name that needs quoting"""
+        db_path = manager.get_database_path("user1", "ds")
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE "lab results" (code TEXT NOT NULL, value REAL)')
+        conn.execute("INSERT INTO \"lab results\" VALUES ('a1', 1.5)")
+        conn.commit()
+        conn.close()
+
+        schema = await manager.get_schema("user1", "ds")
+        lab = schema["tables"][0]
+
+        assert lab["name"] == "lab results"
+        assert [c["nullable"] for c in lab["columns"]] == [False, True]
+        assert lab["sample_rows"] == [{"code": "a1", "value": 1.5}]
+
+    async def test_get_schema_is_cached(self, manager, monkeypatch):
+        """Test that repeated calls do not hit the database"""
+        await manager.get_schema("user1", "ds")
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("schema should come from cache")
+
+        monkeypatch.setattr(manager, "_load_schema", fail)
+        schema = await manager.get_schema("user1", "ds")
+
+        assert schema["tables"][0]["name"] == "people"
+
+    async def test_invalidate_schema(self, manager):
+        """Test that explicit invalidation reloads the schema"""
+        await manager.get_schema("user1", "ds")
+
+        db_path = manager.get_database_path("user1", "ds")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE visits (day TEXT)")
+        conn.commit()
+        conn.close()
+        manager.invalidate_schema("user1", "ds")
+
+        schema = await manager.get_schema("user1", "ds")
+
+        assert [t["name"] for t in schema["tables"]] == ["people", "visits"]
+
+
+class TestSchemaSidecar:
+    """Tests for the on-disk schema sidecar"""
+
+    async def test_sidecar_written_with_fingerprint(self, manager):
+        """Test that loading a schema stores it next to the database"""
+        schema = await manager.get_schema("user1", "ds")
+
+        assert schema["fingerprint"]
+        assert manager.get_schema_meta_path("user1", "ds").exists()
+
+    async def test_sidecar_reused_on_cold_cache(self, manager, monkeypatch):
+        """Test that a fresh manager reads the sidecar instead of SQLite"""
+        first = await manager.get_schema("user1", "ds")
+        manager._schema_cache.clear()
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("schema should come from sidecar")
+
+        monkeypatch.setattr(manager, "_load_schema", fail)
+        schema = await manager.get_schema("user1", "ds")
+
+        assert schema == first
+
+    async def test_sidecar_reused_after_restart(self, manager, monkeypatch):
+        """Test that the sidecar survives close_all() and a new manager"""
+        first = await manager.get_schema("user1", "ds")
+        await manager.close_all()
+
+        restarted = DatabaseManager()
+        restarted.data_path = manager.data_path
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("schema should come from sidecar")
+
+        monkeypatch.setattr(restarted, "_load_schema", fail)
+        try:
+            schema = await restarted.get_schema("user1", "ds")
+        finally:
+            await restarted.close_all()
+
+        assert schema == first
+
+    async def test_sidecar_ignored_after_write_while_stopped(self, manager):
+        """Test that a write made between restarts reloads the schema"""
+        await manager.get_schema("user1", "ds")
+        await manager.close_all()
+
+        db_path = manager.get_database_path("user1", "ds")
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO people VALUES (50, 'c')")
+        conn.commit()
+        conn.close()
+
+        restarted = DatabaseManager()
+        restarted.data_path = manager.data_path
+        try:
+            schema = await restarted.get_schema("user1", "ds")
+        finally:
+            await restarted.close_all()
+
+        assert len(schema["tables"][0]["sample_rows"]) == 3
+
+    async def test_stale_sidecar_ignored(self, manager):
+        """Test that a sidecar for an older file version is not used"""
+        await manager.get_schema("user1", "ds")
+        meta_path = manager.get_schema_meta_path("user1", "ds")
+        meta_path.write_text('{"version": [0], "schema": {"tables": []}}')
+        manager._schema_cache.clear()
+
+        schema = await manager.get_schema("user1", "ds")
+
+        assert [t["name"] for t in schema["tables"]] == ["people"]
+
+    async def test_invalidate_removes_sidecar(self, manager):
+        """Test that invalidation drops the sidecar file"""
+        await manager.get_schema("user1", "ds")
+        manager.invalidate_schema("user1", "ds")
+
+        assert not manager.get_schema_meta_path("user1", "ds").exists()
+
+
+class TestConnectionPool:
+    """Tests for pooled dataset connections"""
+
+    async def test_acquire_applies_pragmas(self, manager):
+        """Test that pooled connections are opened in WAL mode"""
+        async with manager.acquire("user1", "ds") as conn:
+            result = await conn.execute(text("PRAGMA journal_mode"))
+            assert result.scalar() == "wal"
+
+    async def test_execute_query(self, manager):
+        """Test executing a query over a pooled connection"""
+        rows = await manager.execute_query("user1", "ds", "SELECT age FROM people ORDER BY age")
+
+        assert rows == [{"age": 30}, {"age": 40}]
+
+    async def test_execute_query_columnar(self, manager):
+        """Test returning results as one list per column"""
+        sql = "SELECT age, name FROM people ORDER BY age"
+
+        assert await manager.execute_query("user1", "ds", sql, columnar=True) == {
+            "age": [30, 40],
+            "name": ["a", "b"],
+        }
+
+    async def test_stream_query_batches(self, manager):
+        """Test streaming rows in fixed-size batches"""
+        batches = [
+            batch
+            async for batch in manager.stream_query(
+                "user1", "ds", "SELECT age FROM people ORDER BY age", batch_size=1
+            )
+        ]
+
+        assert batches == [[{"age": 30}], [{"age": 40}]]
+
+    async def test_dispose_engine(self, manager):
+        """Test that disposing a dataset engine forgets it"""
+        await manager.get_engine("user1", "ds")
+        await manager.dispose_engine("user1", "ds")
+
+        assert "user1:ds" not in manager.connections
+
+    async def test_engine_cache_is_bounded(self, manager, monkeypatch):
+        """Test that the least recently used engine is evicted when full"""
+        monkeypatch.setattr(manager, "MAX_ENGINES", 2)
+        await manager.get_engine("user1", "a")
+        await manager.get_engine("user1", "b")
+        await manager.get_engine("user1", "a")
+        await manager.get_engine("user1", "c")
+
+        assert list(manager.connections) == ["user1:a", "user1:c"]
+
+    async def test_idle_engines_are_evicted(self, manager, monkeypatch):
+        """Test that engines unused past the idle timeout are disposed"""
+        await manager.get_engine("user1", "a")
+        monkeypatch.setattr(manager, "ENGINE_IDLE_SECONDS", -1)
+        await manager.get_engine("user1", "b")
+
+        assert list(manager.connections) == ["user1:b"]
+
+
+class TestCloneDatabase:
+    """Tests for seeding datasets from another dataset's database file"""
+
+    async def test_clone_is_queryable(self, manager):
+        """Test that a cloned dataset exposes the source tables"""
+        await manager.clone_database("user1", "ds", "user2", "ds")
+
+        rows = await manager.execute_query("user2", "ds", "SELECT COUNT(*) AS n FROM people")
+
+        assert rows == [{"n": 2}]
+
+    async def test_clone_includes_uncheckpointed_writes(self, manager):
+        """Test that rows still in the source's WAL are copied"""
+        engine = await manager.get_engine("user1", "ds")
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO people VALUES (50, 'c')"))
+
+        await manager.clone_database("user1", "ds", "user2", "ds")
+
+        rows = await manager.execute_query("user2", "ds", "SELECT COUNT(*) AS n FROM people")
+        assert rows == [{"n": 3}]
+
+    async def test_source_writes_do_not_reach_clone(self, manager):
+        """Test that writes to the source after cloning leave the clone unchanged"""
+        await manager.clone_database("user1", "ds", "user2", "ds")
+
+        src_db = manager.get_database_path("user1", "ds")
+        conn = sqlite3.connect(src_db)
+        conn.execute("CREATE TABLE secrets (x INTEGER)")
+        conn.execute("INSERT INTO people VALUES (50, 'c')")
+        conn.commit()
+        conn.close()
+
+        dst_db = manager.get_database_path("user2", "ds")
+        assert dst_db.stat().st_ino != src_db.stat().st_ino
+        rows = await manager.execute_query("user2", "ds", "SELECT COUNT(*) AS n FROM people")
+        assert rows == [{"n": 2}]
+        tables = await manager.execute_query(
+            "user2", "ds", "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+        assert tables == [{"name": "people"}]
+
+
+class TestResultCache:
+    """Tests for the small-result cache"""
+
+    async def test_repeated_query_is_cached(self, manager, monkeypatch):
+        """Test that an unchanged database serves results from memory"""
+        sql = "SELECT age FROM people ORDER BY age"
+        # The first connection switches the file to WAL, which changes its stamp
+        await manager.execute_query("user1", "ds", sql, use_cache=True)
+        first = await manager.execute_query("user1", "ds", sql, use_cache=True)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("results should come from cache")
+
+        monkeypatch.setattr(manager, "acquire", fail)
+        second = await manager.execute_query("user1", "ds", sql, use_cache=True)
+
+        assert second == first == [{"age": 30}, {"age": 40}]
+        assert await manager.execute_query("user1", "ds", sql, use_cache=True, columnar=True) == {
+            "age": [30, 40]
+        }
+
+    async def test_write_invalidates_results(self, manager):
+        """Test that a change to the database file bypasses cached rows"""
+        sql = "SELECT COUNT(*) AS n FROM people"
+        await manager.execute_query("user1", "ds", sql, use_cache=True)
+        await manager.execute_query("user1", "ds", sql, use_cache=True)
+
+        async with manager.acquire("user1", "ds") as conn:
+            await conn.execute(text("INSERT INTO people VALUES (50, 'c')"))
+            await conn.commit()
+
+        rows = await manager.execute_query("user1", "ds", sql, use_cache=True)
+
+        assert rows == [{"n": 3}]
+
+
+class TestFirstStatement:
+    """Tests for the SQL statement splitter"""
+
+    def test_single_statement(self):
+        """Test that a lone statement is returned stripped"""
+        assert _first_statement("  SELECT 1  ") == "SELECT 1"
+
+    def test_takes_first_statement(self):
+        """Test that trailing statements are dropped"""
+        assert _first_statement(";; SELECT 1; DROP TABLE t;") == "SELECT 1"
+
+    def test_semicolons_in_literals_and_comments(self):
+        """Test that quoted or commented semicolons do not split"""
+        sql = "SELECT 'a;b', \"c;d\" -- x;y\nFROM t /* ; */ WHERE v = 'it''s;'; SELECT 2"
+
+        assert _first_statement(sql) == sql.split("; SELECT 2")[0]
+
+    def test_empty(self):
+        """Test that input without a statement yields an empty string"""
+        assert _first_statement(" ; ; ") == ""
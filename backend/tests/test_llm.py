@@ -0,0 +1,60 @@
+"""Tests for the LLM client wrapper"""
+import httpx
+from openai import BadRequestError
+from pydantic import BaseModel
+from app.core.llm import LLMClient, _JsonObjectScanner
+
+
+class TestJsonObjectScanner:
+    """Tests for detecting the end of a streamed JSON object"""
+
+    def test_braces_in_strings_are_ignored(self):
+        """Test that quoted braces and escaped quotes do not close the object"""
+        scanner = _JsonObjectScanner()
+
+        assert scanner.feed('{"a": "}\\"{", "b": {') is None
+        assert scanner.feed('"c": 1}}\n\n') == 8
+
+
+class TestGenerateJson:
+    """Tests for streamed JSON generation"""
+
+    async def test_stops_reading_after_object_closes(self):
+        """Test that trailing deltas are never consumed"""
+        llm = LLMClient()
+        consumed = []
+
+        async def fake_stream(*args, **kwargs):
+            for delta in ['{"summary": ', '"ok"}', "\n" * 50, "unreachable"]:
+                consumed.append(delta)
+                yield delta
+
+        llm.stream_chat_completion = fake_stream
+
+        assert await llm.generate_json([{"role": "user", "content": "json"}]) == {"summary": "ok"}
+        assert consumed == ['{"summary": ', '"ok"}']
+
+    async def test_falls_back_to_json_mode(self):
+        """Test that a model without json_schema support is retried in JSON mode once"""
+        llm = LLMClient()
+        formats = []
+
+        class Answer(BaseModel):
+            summary: str
+
+        async def fake_stream(messages, temperature, response_format, *args):
+            formats.append(response_format["type"])
+            if response_format["type"] == "json_schema":
+                request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+                raise BadRequestError(
+                    "Invalid parameter: 'response_format' of type 'json_schema' is not supported",
+                    response=httpx.Response(400, request=request),
+                    body=None,
+                )
+            yield '{"summary": "ok"}'
+
+        llm.stream_chat_completion = fake_stream
+
+        assert await llm.generate_json([], schema=Answer) == {"summary": "ok"}
+        assert await llm.generate_json([], schema=Answer) == {"summary": "ok"}
+        assert formats == ["json_schema", "json_object", "json_object"]
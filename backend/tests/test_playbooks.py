@@ -1,10 +1,17 @@
 """Tests for analysis playbooks"""
+import base64
 import pytest
 import pandas as pd
 import numpy as np
 from app.services import playbooks
 
 
+def _decode_matrix(payload):
+    """Unpack a base64 float32 matrix from playbook metadata"""
+    values = np.frombuffer(base64.b64decode(payload["data"]), dtype="<f4")
+    return values.reshape(payload["shape"])
+
+
 class TestOverviewPlaybook:
     """Tests for overview_playbook"""
 
@@ -46,6 +53,34 @@ class TestCorrelationPlaybook:
         assert "labels" in result["visualization"]["data"]
         assert len(result["visualization"]["data"]["labels"]) <= 3
 
+    def test_correlation_matches_pandas(self, sample_dataframe):
+        """Test that values and the matrix agree with DataFrame.corr()"""
+        result = playbooks.correlation_playbook(sample_dataframe, outcome="outcome")
+        expected = sample_dataframe.select_dtypes(include="number").dropna().corr()
+        matrix = result["visualization"]["metadata"]["correlation_matrix"]
+
+        assert matrix["labels"] == expected.columns.tolist()
+        assert np.allclose(_decode_matrix(matrix), expected.fillna(0.0).values)
+
+    def test_correlation_is_pairwise_complete(self, sample_dataframe):
+        """Test that sparse columns only drop rows for their own pairs"""
+        df = sample_dataframe.astype(float)
+        df.loc[::3, "bmi"] = np.nan
+        df.loc[1::3, "glucose"] = np.nan
+        result = playbooks.correlation_playbook(df, outcome="outcome")
+        matrix = result["visualization"]["metadata"]["correlation_matrix"]
+
+        assert np.allclose(_decode_matrix(matrix), df.corr().fillna(0.0).values)
+
+    def test_correlation_matrix_skipped_for_wide_frames(self, sample_dataframe, monkeypatch):
+        """Test that the metadata matrix is omitted past the column limit"""
+        monkeypatch.setattr(playbooks, "CORRELATION_MATRIX_MAX_COLUMNS", 2)
+        monkeypatch.setattr(playbooks, "_playbook_cache", playbooks.ObjectCache())
+        result = playbooks.correlation_playbook(sample_dataframe, outcome="outcome")
+
+        assert result["visualization"]["metadata"] == {}
+        assert result["visualization"]["data"]["labels"]
+
     def test_correlation_playbook_insufficient_data(self, minimal_dataframe):
         """Test correlation playbook with insufficient data"""
         result = playbooks.correlation_playbook(
@@ -131,6 +166,13 @@ class TestOutcomeBreakdownPlaybook:
         assert result["visualization"]["type"] == "pie"
         assert result["analysis_context"]["kind"] == "outcome_breakdown"
 
+    def test_outcome_breakdown_skips_unused_categories(self):
+        """Test that categories with no rows are left out of the breakdown"""
+        outcome = pd.Categorical(["yes", "no", "yes"], categories=["maybe", "no", "yes"])
+        result = playbooks.outcome_breakdown_playbook(pd.DataFrame({"outcome": outcome}))
+
+        assert result["analysis_context"]["counts"] == {"no": 1, "yes": 2}
+
 
 class TestSegmentComparisonPlaybook:
     """Tests for segment_comparison_playbook"""
@@ -151,6 +193,14 @@ class TestSegmentComparisonPlaybook:
         assert result["analysis_context"]["kind"] == "segment_comparison"
         assert "segments" in result["analysis_context"]
 
+    def test_segment_comparison_ignores_unused_categories(self):
+        """Test that an unused category is not treated as a second cohort"""
+        group = pd.Categorical(["a"] * 5, categories=["a", "b"])
+        df = pd.DataFrame({"group": group, "outcome": [0, 1, 0, 1, 1]})
+        result = playbooks.segment_comparison_playbook(df, segment_column="group", outcome="outcome")
+
+        assert result["analysis_context"]["reason"] == "single_segment_only"
+
 
 class TestRelationshipPlaybook:
     """Tests for relationship_playbook"""
@@ -181,4 +231,115 @@ class TestRelationshipPlaybook:
         assert "feature_x" in result["analysis_context"]
         assert "feature_y" in result["analysis_context"]
 
+    def test_relationship_playbook_downsamples_scatter(self, monkeypatch):
+        """Test that large inputs are thinned for the chart but not the stats"""
+        monkeypatch.setattr(playbooks, "SCATTER_MAX_POINTS", 10)
+        df = pd.DataFrame({"x": np.arange(25), "y": np.arange(25) * 2})
+        result = playbooks.relationship_playbook(df, feature_x="x", feature_y="y")
+
+        assert result["visualization"]["data"]["x"] == list(range(0, 25, 3))
+        assert result["analysis_context"]["point_count"] == 25
+        assert result["analysis_context"]["plotted_points"] == 9
+        assert result["analysis_context"]["correlation"] == 1.0
+
+
+
+class TestFeatureOutcomeProfilePlaybook:
+    """Tests for feature_outcome_profile_playbook"""
+
+    def test_matches_qcut_groupby(self, sample_dataframe):
+        """Test that bins, labels and rates agree with pd.qcut + groupby"""
+        result = playbooks.feature_outcome_profile_playbook(
+            sample_dataframe, feature="age", outcome="outcome"
+        )
+
+        quantiles = pd.qcut(sample_dataframe["age"], q=8, duplicates="drop")
+        grouped = sample_dataframe["outcome"].groupby(quantiles, observed=False).mean().dropna()
+        labels = [f"{round(i.left, 2)}–{round(i.right, 2)}" for i in grouped.index]
+
+        assert result["visualization"]["data"]["x"] == labels
+        assert result["visualization"]["data"]["y"] == [round(v, 3) for v in grouped]
+
+    def test_constant_feature(self):
+        """Test that a feature with a single value reports low variation"""
+        df = pd.DataFrame({"age": [30.0] * 10, "outcome": [0, 1] * 5})
+        result = playbooks.feature_outcome_profile_playbook(df, feature="age", outcome="outcome")
 
+        assert result["analysis_context"]["reason"] == "low_variation"
+
+
+class TestPlaybookCache:
+    """Tests for memoizing whole-frame playbooks"""
+
+    def test_repeat_call_returns_cached_copy(self, sample_dataframe, monkeypatch):
+        """Test that an identical frame is served from cache as a fresh copy"""
+        monkeypatch.setattr(playbooks, "_playbook_cache", playbooks.ObjectCache())
+        monkeypatch.setattr("app.core.cache.settings.debug", False)
+
+        first = playbooks.overview_playbook(sample_dataframe)
+        first["visualization"]["data"]["rows"].clear()
+        second = playbooks.overview_playbook(sample_dataframe.copy())
+
+        assert len(second["visualization"]["data"]["rows"]) == 5
+        assert len(playbooks._playbook_cache) == 1
+
+    def test_hit_matches_miss_with_nan(self, monkeypatch):
+        """Test that cached results equal fresh ones when statistics are NaN"""
+        monkeypatch.setattr(playbooks, "_playbook_cache", playbooks.ObjectCache())
+        monkeypatch.setattr("app.core.cache.settings.debug", False)
+        df = pd.DataFrame({
+            "single": [1.0, np.nan, np.nan, np.nan],
+            "outcome": [0, 1, 0, 1],
+            "value": [1.0, 2.0, 3.0, 5.0],
+        })
+
+        for run in (
+            lambda: playbooks.overview_playbook(df),
+            lambda: playbooks.correlation_playbook(df, outcome="outcome"),
+        ):
+            miss = run()
+            hit = run()
+            assert repr(hit) == repr(miss)
+
+        overview = playbooks.overview_playbook(df)["visualization"]["data"]["rows"]
+        assert np.isnan(overview[0]["Std"])
+
+    def test_fingerprint_tracks_contents(self, sample_dataframe):
+        """Test that changed values or column names change the fingerprint"""
+        changed = sample_dataframe.copy()
+        changed.loc[0, "age"] += 1
+        renamed = sample_dataframe.rename(columns={"age": "years"})
+
+        fingerprint = playbooks.frame_fingerprint(sample_dataframe)
+
+        assert fingerprint == playbooks.frame_fingerprint(sample_dataframe.copy())
+        assert fingerprint != playbooks.frame_fingerprint(changed)
+        assert fingerprint != playbooks.frame_fingerprint(renamed)
+
+
+class TestInferSegmentColumn:
+    """Tests for picking a default segment column"""
+
+    def test_numeric_binary_column_qualifies(self, sample_dataframe):
+        """Test that a 0/1 numeric outcome is chosen after high-cardinality columns"""
+        assert playbooks._infer_segment_column(sample_dataframe) == "outcome"
+
+    def test_no_low_cardinality_column(self):
+        """Test that None is returned when no column has 2-6 levels"""
+        df = pd.DataFrame({"id": range(100), "const": [1] * 100})
+
+        assert playbooks._infer_segment_column(df) is None
+
+
+class TestPreparedFrame:
+    """Tests for sharing derived views across playbooks"""
+
+    def test_playbooks_accept_prepared_frame(self, sample_dataframe):
+        """Test that a PreparedFrame gives the same output as the plain DataFrame"""
+        frame = playbooks.PreparedFrame(sample_dataframe)
+
+        assert playbooks.distribution_playbook(frame, feature="bmi") == playbooks.distribution_playbook(
+            sample_dataframe, feature="bmi"
+        )
+        assert playbooks.relationship_playbook(frame) == playbooks.relationship_playbook(sample_dataframe)
+        assert frame.numeric_df is frame.numeric_df
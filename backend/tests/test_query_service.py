@@ -0,0 +1,61 @@
+"""Tests for the analysis planner"""
+import pytest
+from app.core import cache
+from app.services import query_service
+from app.services.query_service import QueryService
+
+
+SCHEMA = {
+    "fingerprint": "schema-1",
+    "tables": [
+        {
+            "name": "diabetes",
+            "columns": [
+                {"name": "Glucose", "type": "number"},
+                {"name": "Outcome", "type": "number"},
+            ],
+        }
+    ],
+}
+
+
+class FakeLLM:
+    """Planner LLM stand-in that records each call"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_json(self, messages, **kwargs):
+        self.calls += 1
+        return {"intent": "distribution", "feature": "Glucose"}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """QueryService with a fake LLM and an empty plan cache"""
+    monkeypatch.setattr(cache.settings, "debug", False)
+    monkeypatch.setattr(query_service, "response_cache", cache.ResponseCache())
+    return QueryService(llm=FakeLLM())
+
+
+class TestPresetQueries:
+    """Tests for the gallery-question shortcut"""
+
+    async def test_preset_question_skips_llm(self, service):
+        """Test that a gallery question is planned without the LLM"""
+        plan = await service.select_analysis(
+            "  Which features are most strongly related to the main outcome or target in this dataset? ",
+            SCHEMA,
+        )
+
+        assert service.llm.calls == 0
+        assert plan["playbook"] == "correlation"
+        assert plan["target"] == "Outcome"
+
+    async def test_other_questions_use_llm(self, service):
+        """Test that free-form questions still go to the planner"""
+        plan = await service.select_analysis("Show glucose spread", SCHEMA)
+
+        assert service.llm.calls == 1
+        assert plan["playbook"] == "distribution"
+        assert plan["feature"] == "Glucose"
@@ -0,0 +1,38 @@
+"""Tests for SQL validation"""
+from app.core.security import SQLValidator
+
+
+class TestValidateSQL:
+    """Tests for SQLValidator.validate_sql"""
+
+    def test_select_is_valid(self):
+        """Test that a plain SELECT on an allowed table passes"""
+        assert SQLValidator.validate_sql("SELECT * FROM patients", ["patients"]) == (True, "")
+
+    def test_dangerous_keyword_rejected(self):
+        """Test that write keywords are reported by name"""
+        valid, message = SQLValidator.validate_sql("SELECT 1; drop table patients")
+
+        assert valid is False
+        assert "'DROP'" in message
+
+    def test_keyword_inside_identifier_allowed(self):
+        """Test that keywords embedded in identifiers are not flagged"""
+        valid, _ = SQLValidator.validate_sql("SELECT created_at, updated_by FROM t", ["t"])
+
+        assert valid is True
+
+    def test_unknown_table_rejected(self):
+        """Test that tables outside the allowed list are rejected"""
+        valid, message = SQLValidator.validate_sql("SELECT * FROM secrets", ["patients"])
+
+        assert valid is False
+        assert "SECRETS" in message
+
+    def test_results_are_memoized(self):
+        """Test that repeated validation is served from the cache"""
+        SQLValidator._validate.cache_clear()
+        SQLValidator.validate_sql("SELECT * FROM a JOIN b ON 1", ["a", "b"])
+        SQLValidator.validate_sql("SELECT * FROM a JOIN b ON 1", ["b", "a"])
+
+        assert SQLValidator._validate.cache_info().hits == 1
@@ -51,6 +51,13 @@ export interface VisualizationConfig {
     y_axis?: string;
     labels?: string;
     values?: string;
+    // Base64 little-endian float32 buffer; decode with atob + Float32Array
+    correlation_matrix?: {
+      labels: string[];
+      dtype: 'float32';
+      shape: [number, number];
+      data: string;
+    };
   };
 }
 